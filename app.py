@@ -1,160 +1,322 @@
 # app.py → VERSIONE PULITA – CONFRONTI ANNO SU ANNO MIGLIORATI
+import os
+import time
 import streamlit as st
 import pandas as pd
 import altair as alt
 import numpy as np
-import os
-import glob
-import re
+
+from ingest_utils import week_label
+from master_utils import ARROW_PATH, read_master, read_master_arrow, list_partitions, master_version, version_info
+from filter_utils import sort_by_publisher, build_publisher_index, match_publishers, build_filter_index, filter_positions, filter_key
+from rollup_utils import query_rollup
+from trend_utils import weekly_trend
+from table_utils import TABLE_PAGE_SIZE, EXPORT_FORMATS, sort_positions, top_rows, table_page, export_bytes
+from heatmap_utils import heatmap_page, page_count
+from matrix_utils import build_title_matrix, matrix_rows
+from tab_utils import focus_rows, variation_data, streak_data, insight_data, yoy_data
+from streak_utils import load_streaks, streak_leaderboard
+from viz_utils import variation_heatmap, streak_heatmap, top_bar_chart, collana_pie_chart, weekly_units_chart, yoy_titles_chart
+from series_utils import load_series, title_stats, title_history, sparklines
+from query_utils import QUERY_BACKEND, backend_name, aggregate
+from build_utils import BUILD_LOG_PATH, build_running, start_background_build
+from cache_utils import cache_stats, disk_cache
+from perf_utils import PERF_ENABLED, start_run, stage, count, record_payload, finish_run, runs_to_jsonl
+from search_utils import SEARCH_COLUMNS, load_vocabulary, build_search_index, allowed_ids, search
 
 # ================================================
-# CREAZIONE PARQUET (se non esiste) – GESTIONE ANNI MULTIPLI
+# STRUMENTAZIONE (opzionale: PERF_TRACE=1 oppure ?debug=1)
 # ================================================
-MASTER_PATH = "data/master_sales.parquet"
-
-if not os.path.exists(MASTER_PATH):
-    st.info("Creo il database master... (solo la prima volta)")
-    dfs = []
-    years = ["2025", "2026"]  # Aggiungi nuovi anni qui (es. "2027")
-    for year in years:
-        files = sorted(glob.glob(f"data/{year}/Classifica week*.xlsx"))
-        if not files:
-            st.warning(f"Nessun file trovato in data/{year}/ – salto l'anno")
-            continue
-
-        for f in files:
-            m = re.search(r'(?:week|Settimana)\s*(\d+)', f, re.I)
-            week_num = m.group(1) if m else "999"
-            try:
-                df = pd.read_excel(f, sheet_name="Export")
-                df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-
-                units_col = next((c for c in df.columns if c in ["units","unità_vendute","vendite","unità","copie","qty"]), None)
-                if not units_col: continue
-                df = df.rename(columns={units_col: "units"})
-                df["units"] = pd.to_numeric(df["units"], errors="coerce").fillna(0)
-
-                # Fatturato: prima "value"
-                value_col = next((c for c in df.columns if "value" in c.lower()), None)
-                if value_col:
-                    df = df.rename(columns={value_col: "fatturato"})
-                    df["fatturato"] = df["fatturato"].astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-                    df["fatturato"] = pd.to_numeric(df["fatturato"], errors="coerce").fillna(0)
-                else:
-                    price_col = next((c for c in df.columns if "cover" in c.lower() and "price" in c.lower()), None)
-                    if price_col:
-                        df = df.rename(columns={price_col: "cover_price"})
-                        df["cover_price"] = df["cover_price"].astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-                        df["cover_price"] = pd.to_numeric(df["cover_price"], errors="coerce").fillna(0)
-                        df["fatturato"] = df["units"] * df["cover_price"]
-                    else:
-                        df["fatturato"] = 0.0
-
-                df["week"] = f"Settimana {week_num.zfill(2)}"
-                df["year"] = int(year)
-
-                for col in ["collana","collection","series","collection/series"]:
-                    if col in df.columns:
-                        df = df.rename(columns={col: "collana"})
-                        break
-
-                keep = ["title","author","publisher","units","fatturato","week","year"]
-                if "collana" in df.columns: keep.append("collana")
-                dfs.append(df[keep])
-            except Exception as e:
-                st.warning(f"Errore lettura {os.path.basename(f)}: {e}")
-
-    master = pd.concat(dfs, ignore_index=True)
-    master["units"] = pd.to_numeric(master["units"], errors="coerce").fillna(0).astype(int)
-    master["fatturato"] = pd.to_numeric(master["fatturato"], errors="coerce").fillna(0)
-    master["title"] = master["title"].astype(str).str.strip()
-    master["publisher"] = master["publisher"].astype(str).str.strip().str.title()
-    if "collana" in master.columns:
-        master["collana"] = master["collana"].astype(str).str.strip()
-
-    master.to_parquet(MASTER_PATH, compression="zstd")
-    st.success(f"Database master creato: {len(master):,} righe")
+perf_on = PERF_ENABLED or st.query_params.get("debug") == "1"
+start_run(perf_on, st.session_state.setdefault("perf_session", np.random.randint(1 << 30)))
+
+def show_chart(chart, **kwargs):
+    with stage("altair_chart") as rec:
+        record_payload(rec, chart)
+        st.altair_chart(chart, **kwargs)
+
+def perf_panel(run):
+    # Pannello nascosto nella sidebar: stage dell'ultimo rerun + storico scaricabile
+    if run is None:
+        return
+    history = st.session_state.setdefault("perf_runs", [])
+    history.append(run)
+    del history[:-50]
+    with st.sidebar.expander("Prestazioni (debug)"):
+        memory = "attiva" if run["memory"] else "spenta (PERF_TRACE=1 PERF_TRACE_MEMORY=1)"
+        st.caption(f"Rerun {run['run_id']}: {run['total_seconds']:.3f}s · misura memoria {memory}")
+        stages = pd.DataFrame(run["stages"])
+        stages["stage"] = ["· " * d + s for d, s in zip(stages["depth"], stages["stage"])]
+        st.dataframe(stages.drop(columns=["depth"]), hide_index=True)
+        if run["counters"]:
+            st.json(run["counters"])
+        stats = cache_stats()
+        st.caption(f"Cache risultati: {stats['hits']} hit, {stats['misses']} miss, {stats['evictions']} evict, "
+                   f"{stats['mb']}/{stats['budget_mb']:g} MB; disco {stats['disk_hits']} hit, {stats['disk_misses']} miss")
+        st.download_button("Scarica JSONL", runs_to_jsonl(history), "perf_runs.jsonl", "application/jsonl")
 
 # ================================================
 # CARICA DATABASE
 # ================================================
-@st.cache_data(ttl=3600)
-def load_master():
-    return pd.read_parquet(MASTER_PATH)
-
-df_all = load_master()
-
-st.set_page_config(page_title="Dashboard Vendite Libri", layout="wide")
-st.title("Dashboard Vendite Libri")
+# Motore per le aggregazioni non coperte dai rollup: QUERY_BACKEND=pandas|duckdb
+query_backend = backend_name()
+if QUERY_BACKEND == "duckdb" and query_backend != "duckdb":
+    st.sidebar.warning("DuckDB non è installato: uso pandas.")
+
+@st.cache_resource(max_entries=1)
+def load_master_indexed(version):
+    # Master completo condiviso (da non modificare) + indice editore → intervallo di righe
+    # + indice dei filtri della sidebar
+    count("cache_miss:load_master_indexed")
+    if os.path.exists(ARROW_PATH):
+        # Mappato in memoria e già ordinato: nessuna copia delle colonne numeriche
+        master = read_master_arrow()
+    else:
+        master = sort_by_publisher(read_master())
+    return master, build_publisher_index(master), build_filter_index(master)
+
+@st.cache_data(max_entries=64)
+def load_rollup(version, group_by, filters):
+    count("cache_miss:load_rollup")
+    return query_rollup(group_by, filters)
+
+def sum_units(df, group_by, rollup_filters):
+    # Rollup precalcolato se copre gruppo e filtri, altrimenti groupby sulle righe
+    # ("df" può essere una funzione che le produce solo quando servono)
+    with stage(f"sum_units:{'+'.join(group_by)}") as rec:
+        agg = load_rollup(version, group_by, rollup_filters)
+        if agg is None and query_backend == "duckdb":
+            count("duckdb_query")
+            agg = load_aggregate(version, tuple(group_by), rollup_filters)
+        elif agg is None:
+            count("rollup_fallback")
+            if callable(df):
+                df = df()
+            rec["rows_in"] = len(df)
+            agg = df.groupby(group_by, observed=True)["units"].sum().reset_index()
+        rec["rows_out"] = len(agg)
+    return agg
+
+@st.cache_data(max_entries=64)
+def load_aggregate(version, group_by, filters):
+    # Somma per gruppo calcolata dal motore configurato (DuckDB: SQL sul parquet partizionato)
+    count("cache_miss:load_aggregate")
+    return aggregate(list(group_by), filters, backend=query_backend)
+
+@st.cache_resource(max_entries=1)
+@disk_cache("title_matrix", modules=["matrix_utils", "master_utils", "filter_utils"], functions=[load_master_indexed])
+def load_title_matrix(version):
+    # Matrice titolo × anno × settimana per i confronti anno su anno
+    count("cache_miss:load_title_matrix")
+    master, _, _ = load_master_indexed(version)
+    return build_title_matrix(master)
+
+@st.cache_resource(max_entries=8)
+def sorted_rows(version, rollup_filters, sort_by, ascending):
+    # Posizioni filtrate e ordinate lato server, condivise tra le pagine della tabella
+    count("cache_miss:sorted_rows")
+    master, _, index = load_master_indexed(version)
+    return sort_positions(master, filter_positions(index, rollup_filters), sort_by, ascending)
+
+@st.cache_data(max_entries=1)
+def load_streak_table(version):
+    # Streak per titolo di tutti gli editori, aggiornate in fase di build
+    return load_streaks()
+
+@st.cache_resource(max_entries=1)
+def load_series_store(version):
+    # Serie per titolo (unità, fatturato, posizione) precalcolate in fase di build
+    count("cache_miss:load_series_store")
+    return load_series()
+
+@st.cache_resource(max_entries=1)
+def load_search(version):
+    # Vocabolario precalcolato in fase di build + indice per prefisso/n-grammi
+    count("cache_miss:load_search")
+    vocab = load_vocabulary()
+    return vocab, build_search_index(vocab)
+
+@st.cache_data(max_entries=1)
+def load_partitions(version):
+    return list_partitions()
 
-tab_principale, tab_adelphi, tab_streak, tab_insight_adelphi, tab_confronti = st.tabs([
-    "Principale", 
-    "Analisi Adelphi", 
-    "Streak Adelphi", 
-    "Insight Adelphi (Vendite)", 
-    "Confronti Anno su Anno"
-])
+# ================================================
+# VERSIONE PUBBLICATA – LA BUILD GIRA FUORI DALL'APP (create_parquet.py)
+# ================================================
+# Tutte le cache sono indicizzate dal token: una nuova build si vede al rerun successivo
+version = master_version()
+if version is None:
+    # Primo avvio (deploy nuovo): la build parte in background, la pagina si ricarica da sola
+    if not build_running():
+        if st.session_state.get("build_started"):
+            # Build avviata da questa sessione e finita senza pubblicare nulla
+            st.error("Build del database master non riuscita: ultime righe di " + BUILD_LOG_PATH)
+            with open(BUILD_LOG_PATH, encoding="utf-8", errors="replace") as fh:
+                st.code("".join(fh.readlines()[-20:]))
+            st.stop()
+        st.session_state["build_started"] = start_background_build()
+    st.info("Database master in costruzione (qualche minuto al primo avvio): la pagina si aggiorna da sola.")
+    time.sleep(15)
+    st.rerun()
+build = version_info()
+st.sidebar.caption(f"Dati: versione {version} del {build['built_at'][:16].replace('T', ' ')} UTC")
+partitions = load_partitions(version)
+with stage("load_master") as rec:
+    master_all, publisher_index, filter_index = load_master_indexed(version)
+    rec["rows_out"] = len(master_all)
+with stage("load_search"):
+    vocab, search_index = load_search(version)
+with stage("load_series"):
+    series_store = load_series_store(version)
 
 # ===================================================================
-# TAB PRINCIPALE
+# SIDEBAR – FILTRI (condivisi da tutte le viste)
 # ===================================================================
-with tab_principale:
-    week_options = ["Tutti"] + sorted(df_all["week"].unique(), key=lambda x: int(x.split()[-1]))
-    selected_week = st.sidebar.selectbox("Settimana", week_options, index=0)
+# Editore "focus" delle analisi dedicate: risolto sul vocabolario, poi intervalli di righe dall'indice
+focus = st.sidebar.text_input("Editore focus", "Adelphi").strip() or "Adelphi"
+focus_publishers = match_publishers(search_index["publisher"]["values"], focus)
 
-    # Filtro Anno – default 2026
-    available_years = sorted(df_all["year"].unique())
-    default_year = [2026] if 2026 in available_years else available_years[-1:]
-    selected_years = st.sidebar.multiselect("Anno", ["Tutti"] + available_years, default=default_year)
+st.set_page_config(page_title="Dashboard Vendite Libri", layout="wide")
+st.title("Dashboard Vendite Libri")
 
-    st.sidebar.header("Filtri")
-    filters = {}
-    for col, label in [("publisher","Editore"), ("author","Autore"), ("title","Titolo"), ("collana","Collana")]:
-        if col in df_all.columns:
-            opts = ["Tutti"] + sorted(df_all[col].dropna().astype(str).unique().tolist())
-            chosen = st.sidebar.multiselect(label, opts, default="Tutti")
-            if "Tutti" not in chosen and chosen:
-                filters[col] = chosen
+week_options = ["Tutti"] + [week_label(w) for w in sorted({w for _, w in partitions})]
+selected_week = st.sidebar.selectbox("Settimana", week_options, index=0)
 
-    if st.sidebar.button("Reimposta filtri"):
-        st.rerun()
+# Filtro Anno – default 2026
+available_years = sorted({y for y, _ in partitions})
+default_year = [2026] if 2026 in available_years else available_years[-1:]
+selected_years = st.sidebar.multiselect("Anno", ["Tutti"] + available_years, default=default_year)
 
-    df = df_all.copy()
-    if "Tutti" not in selected_years:
-        df = df[df["year"].isin(selected_years)]
+st.sidebar.header("Filtri")
+filters = {}
+# Al browser arrivano solo i primi risultati della ricerca (più le scelte già fatte),
+# ristretti a cascata dalle selezioni precedenti: editore → autore → titolo → collana
+with stage("ricerca_sidebar"):
+    for col, label in [("publisher","Editore"), ("author","Autore"), ("title","Titolo"), ("collana","Collana")]:
+        query = st.sidebar.text_input(f"Cerca {label.lower()}", key=f"q_{col}")
+        allowed = allowed_ids(search_index, vocab, col, filters)
+        current = [v for v in st.session_state.get(f"f_{col}", []) if v != "Tutti"]
+        matches = search(search_index, col, query, allowed=allowed)
+        opts = ["Tutti"] + current + [m for m in matches if m not in current]
+        chosen = st.sidebar.multiselect(label, opts, default="Tutti", key=f"f_{col}")
+        if "Tutti" not in chosen and chosen:
+            filters[col] = chosen
+
+if st.sidebar.button("Reimposta filtri"):
+    for col in SEARCH_COLUMNS:
+        st.session_state.pop(f"q_{col}", None)
+        st.session_state.pop(f"f_{col}", None)
+    st.rerun()
 
-    if selected_week != "Tutti":
-        df = df[df["week"] == selected_week]
-    for col, vals in filters.items():
-        df = df[df[col].isin(vals)]
+# ===================================================================
+# CALCOLI DELLE VISTE FOCUS – IN CACHE PER (VERSIONE MASTER, FILTRI)
+# ===================================================================
+# Anche su disco: dopo un riavvio o un redeploy le viste già calcolate non si ricalcolano
+@st.cache_data(max_entries=32)
+@disk_cache("focus_view", modules=["tab_utils", "rollup_utils", "query_utils", "master_utils"],
+            functions=[load_master_indexed, load_title_matrix, sum_units, load_rollup, load_aggregate])
+def compute_focus_view(view, version, focus_publishers, title_filter, collana_filter):
+    count(f"cache_miss:compute_focus_view:{view}")
+    master, publisher_index, _ = load_master_indexed(version)
+    view_filters = {"title": title_filter, "collana": collana_filter}
+    if view == "confronti":
+        matrix = load_title_matrix(version)
+        rows = matrix_rows(matrix, focus_publishers, view_filters)
+        return yoy_data(matrix, rows) if len(rows) else None
+    rows = focus_rows(master, publisher_index, focus_publishers, view_filters)
+    if rows.empty:
+        return None
+    if view == "variazioni":
+        return variation_data(rows)
+    if view == "streak":
+        return streak_data(rows)
+    summarize = lambda group_by: sum_units(rows, group_by, {"publisher": focus_publishers, **view_filters})
+    return insight_data(rows, summarize)
+
+def focus_view(view):
+    with stage(f"calcolo:{view}"):
+        return compute_focus_view(view, version, tuple(focus_publishers), filters.get("title"), filters.get("collana"))
 
-    if df.empty:
+# ===================================================================
+# VISTA PRINCIPALE
+# ===================================================================
+SPARK_WEEKS = 26
+SERIES_MAX_TITLES = 10
+TABLE_SORT_COLUMNS = ["units", "fatturato", "rank", "title", "author", "publisher", "collana", "year", "week"]
+
+def render_principale():
+    rollup_filters = {
+        "year": None if "Tutti" in selected_years else selected_years,
+        "week": None if selected_week == "Tutti" else [selected_week],
+        **filters,
+    }
+    # Intersezione degli indici per valore (con cache LRU): nessuna copia delle righe filtrate
+    with stage("filtri", rows_in=len(master_all)) as rec:
+        positions = filter_positions(filter_index, rollup_filters)
+        rec["rows_out"] = len(positions)
+
+    if len(positions) == 0:
         st.warning("Nessun dato con i filtri selezionati.")
         st.stop()
 
-    csv = df.to_csv(index=False).encode()
     c1, c2 = st.columns([4,1])
     with c1:
         st.subheader(f"Dati – {selected_week}")
-        st.dataframe(df.drop(columns=["source_file"], errors="ignore"), use_container_width=True)
+        s1, s2, s3 = st.columns([2,1,1])
+        sort_by = s1.selectbox("Ordina per", TABLE_SORT_COLUMNS, key="table_sort")
+        descending = s2.toggle("Decrescente", value=True, key="table_desc")
+        n_pages = max(1, -(-len(positions) // TABLE_PAGE_SIZE))
+        page_num = s3.number_input("Pagina", 1, n_pages, 1, key="table_page")
+        with stage("tabella", rows_in=len(positions)) as rec:
+            ordered = sorted_rows(version, rollup_filters, sort_by, not descending)
+            page = table_page(master_all, ordered, page_num)
+            # Sparkline dalle serie per titolo: una fetta per riga della pagina, nessun filtro sul master
+            rows_page = page["rows"].assign(andamento=sparklines(series_store, page["rows"]["title"], SPARK_WEEKS))
+            st.dataframe(rows_page, use_container_width=True, hide_index=True, column_config={
+                "andamento": st.column_config.LineChartColumn(f"Ultime {SPARK_WEEKS} settimane", y_min=0)})
+            rec["rows_out"] = len(page["rows"])
+        st.caption(f"Righe {page['first']:,}–{page['last']:,} di {len(positions):,}")
     with c2:
-        st.download_button("Scarica CSV", csv, f"vendite_{selected_week}.csv", "text/csv")
-
+        fmt = st.radio("Formato", list(EXPORT_FORMATS), key="export_format")
+        ext, mime = EXPORT_FORMATS[fmt]
+        cache_key = (version, filter_key(rollup_filters))
+        # Il file si genera solo al click (callable), in un thread separato
+        st.download_button(f"Scarica {fmt}", lambda: export_bytes(master_all, positions, fmt, cache_key),
+                           f"vendite_{selected_week}.{ext}", mime)
+
+    if filters.get("title"):
+        st.subheader("Storico in classifica")
+        chosen = filters["title"][:SERIES_MAX_TITLES]
+        st.dataframe(title_stats(series_store, chosen).rename(columns={
+            "weeks": "Settimane in classifica", "best_rank": "Miglior posizione",
+            "weeks_top10": "Settimane in top 10", "units": "Unità totali"}), hide_index=True)
+        history = pd.concat([title_history(series_store, t).assign(title=t) for t in chosen], ignore_index=True)
+        history = history.sort_values(["year", "week_num"], kind="stable")
+        history["periodo"] = history["year"].astype(str) + " " + history["week"].astype(str)
+        # Settimane senza posizione fuori dal grafico (0 starebbe sopra il primo posto)
+        show_chart(alt.Chart(history[history["rank"] > 0]).mark_line(point=True).encode(
+            x=alt.X("periodo:N", sort=history["periodo"].unique().tolist(), title=None),
+            y=alt.Y("rank:Q", scale=alt.Scale(reverse=True), title="Posizione"),
+            color="title:N",
+            tooltip=["title", "year", "week", "rank", "units"]
+        ).properties(height=300), use_container_width=True)
+
+    # Le righe filtrate si copiano solo se nessun rollup copre il raggruppamento
+    rows = lambda: master_all.take(positions)
     st.subheader("Top – Totali filtrati")
     c1,c2,c3 = st.columns(3)
     with c1:
-        top = df.nlargest(20,"units")[["title","units"]]
-        st.altair_chart(alt.Chart(top).mark_bar().encode(x=alt.X("title:N",sort="-y"),y="units:Q"), use_container_width=True)
+        top = top_rows(master_all, positions, "units", 20)[["title","units"]]
+        show_chart(alt.Chart(top).mark_bar().encode(x=alt.X("title:N",sort="-y"),y="units:Q"), use_container_width=True)
     with c2:
-        top = df.groupby("author")["units"].sum().nlargest(10).reset_index()
-        st.altair_chart(alt.Chart(top).mark_bar().encode(x=alt.X("author:N",sort="-y"),y="units:Q"), use_container_width=True)
+        top = sum_units(rows, ["author"], rollup_filters).nlargest(10, "units")[["author","units"]]
+        show_chart(alt.Chart(top).mark_bar().encode(x=alt.X("author:N",sort="-y"),y="units:Q"), use_container_width=True)
     with c3:
-        top = df.groupby("publisher")["units"].sum().nlargest(10).reset_index()
-        st.altair_chart(alt.Chart(top).mark_bar().encode(x=alt.X("publisher:N",sort="-y"),y="units:Q"), use_container_width=True)
+        top = sum_units(rows, ["publisher"], rollup_filters).nlargest(10, "units")[["publisher","units"]]
+        show_chart(alt.Chart(top).mark_bar().encode(x=alt.X("publisher:N",sort="-y"),y="units:Q"), use_container_width=True)
 
     if selected_week == "Tutti" and any(filters.values()):
         st.subheader("Andamento Settimanale")
-        trend_cum = []
         filter_type = None
         filter_values = None
         for col in ["author", "publisher", "collana", "title"]:
@@ -164,17 +326,18 @@ with tab_principale:
                 break
 
         if filter_type and filter_values:
-            for w in week_options[1:]:
-                temp = df_all[df_all["week"]==w]
-                for val in filter_values:
-                    temp_val = temp[temp[col] == val]
-                    units = int(temp_val["units"].sum())
-                    trend_cum.append({"Settimana": w, "Unità": units, "Item": val})
-
-            if trend_cum:
-                df_cum = pd.DataFrame(trend_cum)
+            # Rollup (settimana, dimensione) se disponibile, altrimenti DuckDB o le righe del master
+            source = load_rollup(version, ["week", col], {col: filter_values})
+            if source is None and query_backend == "duckdb":
+                source = load_aggregate(version, ("week", col), {col: filter_values})
+            if source is None:
+                source = master_all
+            trend_cum = weekly_trend(source, col, filter_values, week_options[1:])
+
+            if not trend_cum.empty:
+                df_cum = trend_cum.rename(columns={"week": "Settimana", "units": "Unità", "item": "Item"})
                 st.subheader(f"Andamento cumulativo per {filter_type}")
-                st.altair_chart(alt.Chart(df_cum).mark_line(point=True).encode(
+                show_chart(alt.Chart(df_cum).mark_line(point=True).encode(
                     x=alt.X("Settimana:N", sort=week_options[1:]),
                     y="Unità:Q",
                     color="Item:N",
@@ -182,21 +345,16 @@ with tab_principale:
                 ).properties(height=500), use_container_width=True)
 
         if filters.get("author") or filters.get("collana"):
-            trend_books = []
-            for w in week_options[1:]:
-                temp = df_all[df_all["week"]==w]
-                for col, vals in filters.items():
-                    if col in ["author", "collana"]:
-                        temp = temp[temp[col].isin(vals)]
-                for title in temp["title"].unique():
-                    temp_title = temp[temp["title"] == title]
-                    units = int(temp_title["units"].sum())
-                    trend_books.append({"Settimana": w, "Unità": units, "Libro": title})
-
-            if trend_books:
-                df_books = pd.DataFrame(trend_books)
+            books = master_all
+            for col, vals in filters.items():
+                if col in ["author", "collana"]:
+                    books = books[books[col].isin(vals)]
+            trend_books = weekly_trend(books, "title")
+
+            if not trend_books.empty:
+                df_books = trend_books.rename(columns={"week": "Settimana", "units": "Unità", "item": "Libro"})
                 st.subheader("Andamento per singolo libro")
-                st.altair_chart(alt.Chart(df_books).mark_line(point=True).encode(
+                show_chart(alt.Chart(df_books).mark_line(point=True).encode(
                     x=alt.X("Settimana:N", sort=week_options[1:]),
                     y="Unità:Q",
                     color="Libro:N",
@@ -204,226 +362,135 @@ with tab_principale:
                 ).properties(height=600), use_container_width=True)
 
 # ===================================================================
-# TAB ANALISI ADELPHI – HEATMAP % (20px)
+# HEATMAP A PAGINE – AL BROWSER AL MASSIMO HEATMAP_MAX_CELLS CELLE
 # ===================================================================
-with tab_adelphi:
-    st.header("Analisi Variazioni Settimanali – Adelphi")
+def heatmap_pager(data, key):
+    # Righe già ordinate per vendite: si sceglie solo la pagina da disegnare
+    n_pages = page_count(data["cells"], data["order"])
+    page_num = st.number_input("Pagina", 1, n_pages, 1, key=key) if n_pages > 1 else 1
+    page = heatmap_page(data["cells"], data["idx"], data["order"], page_num)
+    first = (page["page"] - 1) * page["per_page"] + 1
+    st.caption(f"Titoli {first}–{first + len(page['rows']) - 1} di {page['n_rows']} (pagina {page['page']} di {page['n_pages']})")
+    return page
 
-    adelphi = df_all[df_all["publisher"].str.contains("Adelphi", case=False, na=False)].copy()
-    if adelphi.empty:
-        st.info("Nessun dato Adelphi trovato.")
-    else:
-        adelphi["units"] = pd.to_numeric(adelphi["units"], errors="coerce").fillna(0)
+# ===================================================================
+# VISTA ANALISI FOCUS – HEATMAP % (20px)
+# ===================================================================
+def render_variazioni():
+    st.header(f"Analisi Variazioni Settimanali – {focus}")
 
-        for col in ["title", "collana"]:
-            if filters.get(col):
-                adelphi = adelphi[adelphi[col].isin(filters[col])]
-
-        grp = ["title", "week"]
-        if "collana" in adelphi.columns:
-            grp.insert(1, "collana")
-        adelphi = adelphi.groupby(grp)["units"].sum().reset_index()
-
-        key = ["title"] + (["collana"] if "collana" in grp else [])
-        adelphi["prev"] = adelphi.groupby(key)["units"].shift(1)
-        adelphi["Diff_%"] = np.where(
-            adelphi["prev"] > 0,
-            (adelphi["units"] - adelphi["prev"]) / adelphi["prev"] * 100,
-            np.nan
-        )
-
-        idx = "title"
-        if "collana" in adelphi.columns:
-            adelphi["title_collana"] = adelphi["title"] + " (" + adelphi["collana"].fillna("—") + ")"
-            idx = "title_collana"
-
-        pivot = adelphi.pivot(index=idx, columns="week", values="Diff_%").fillna(0)
-        long = pivot.reset_index().melt(id_vars=idx, var_name="week", value_name="Diff_%")
-        long = long.merge(adelphi[[idx, "week", "units"]], on=[idx, "week"], how="left")
-
-        if not long.empty:
-            num_books = long[idx].nunique()
-            dynamic_height = max(600, num_books * 20)  # 20px per libro
-
-            chart = alt.Chart(long).mark_rect(
-                stroke='gray',
-                strokeWidth=0.5
-            ).encode(
-                x=alt.X("week:N", sort=week_options[1:], title="Settimana"),
-                y=alt.Y(f"{idx}:N", sort=alt.EncodingSortField(field="units", op="sum", order="descending")),
-                color=alt.Color("Diff_%:Q", scale=alt.Scale(scheme="redyellowgreen", domainMid=0), title="Variazione %"),
-                tooltip=[idx, "week", alt.Tooltip("units:Q", title="Unità vendute"), alt.Tooltip("Diff_%:Q", format=".1f", title="Variazione %")]
-            ).properties(
-                width=900,
-                height=dynamic_height
-            ).configure_axis(labelFontSize=11, titleFontSize=13)
-
-            st.altair_chart(chart, use_container_width=True)
-
-        st.dataframe(adelphi[["title","collana","week","units","Diff_%"]].sort_values(["title","week"]))
+    data = focus_view("variazioni")
+    if data is None:
+        st.info(f"Nessun dato {focus} trovato.")
+        return
+    idx = data["idx"]
+
+    if data["order"]:
+        page = heatmap_pager(data, "page_variazioni")
+        show_chart(variation_heatmap(page["cells"], idx, page["rows"], week_options[1:]), use_container_width=True)
+
+    st.dataframe(data["table"][["title","collana","week","units","Diff_%"]].sort_values(["title","week"]))
 
 # ===================================================================
-# TAB STREAK ADELPHI – CLASSIFICA SOPRA + HEATMAP VERDE/ROSSO/BIANCO (20px)
+# VISTA STREAK FOCUS – CLASSIFICA SOPRA + HEATMAP VERDE/ROSSO/BIANCO (20px)
 # ===================================================================
-with tab_streak:
-    st.header("Streak Adelphi – Crescita/Declino Continuo")
-
-    streak_data = df_all[df_all["publisher"].str.contains("Adelphi", case=False, na=False)].copy()
-    if streak_data.empty:
-        st.info("Nessun dato Adelphi trovato.")
+def render_streak():
+    st.header(f"Streak {focus} – Crescita/Declino Continuo")
+
+    all_publishers = st.checkbox("Tutti gli editori", key="streak_all")
+    board = streak_leaderboard(
+        load_streak_table(version),
+        None if all_publishers else focus_publishers,
+        {"title": filters.get("title"), "collana": filters.get("collana")},
+    )
+    board = board[board["longest_up"] > 0]
+    st.subheader("Top 20 Streak Positive (settimane consecutive di crescita)")
+    if not board.empty:
+        cols = (["publisher"] if all_publishers else []) + ["title", "collana", "longest_up", "current_up",
+                "longest_down", "weeks_in_chart", "last_units", "last_week", "last_year"]
+        st.dataframe(board[cols], hide_index=True)
     else:
-        streak_data["units"] = pd.to_numeric(streak_data["units"], errors="coerce").fillna(0)
+        st.info("Nessuna streak positiva trovata.")
 
-        for col in ["title", "collana"]:
-            if filters.get(col):
-                streak_data = streak_data[streak_data[col].isin(filters[col])]
-
-        grp = ["title", "week"]
-        if "collana" in streak_data.columns:
-            grp.insert(1, "collana")
-        streak_data = streak_data.groupby(grp)["units"].sum().reset_index()
-
-        key = ["title"] + (["collana"] if "collana" in grp else [])
-        streak_data = streak_data.sort_values(key + ["week"])
-        streak_data["diff"] = streak_data.groupby(key)["units"].diff()
-
-        streak_data["color"] = np.where(streak_data["diff"] > 0, "green",
-                              np.where(streak_data["diff"] < 0, "red", "white"))
-
-        idx = "title"
-        if "collana" in streak_data.columns:
-            streak_data["title_collana"] = streak_data["title"] + " (" + streak_data["collana"].fillna("—") + ")"
-            idx = "title_collana"
-
-        st.subheader("Top 20 Streak Positive (settimane consecutive di crescita)")
-        streak_calc = streak_data.copy()
-        streak_calc["is_up"] = (streak_calc["diff"] > 0).astype(int)
-        streak_calc["streak_group"] = (streak_calc["is_up"] != streak_calc["is_up"].shift()).cumsum()
-        streaks = streak_calc[streak_calc["is_up"] == 1].groupby([idx, "streak_group"]).agg(
-            streak_length=("week", "count"),
-            last_units=("units", "last"),
-            last_week=("week", "last")
-        ).reset_index()
-        streaks = streaks.sort_values("streak_length", ascending=False).head(20)
-
-        if not streaks.empty:
-            st.dataframe(streaks[[idx, "streak_length", "last_units", "last_week"]])
-        else:
-            st.info("Nessuna streak positiva trovata.")
-
-        pivot_color = streak_data.pivot(index=idx, columns="week", values="color").fillna("white")
-        long_color = pivot_color.reset_index().melt(id_vars=idx, var_name="week", value_name="color")
-        long_color = long_color.merge(streak_data[[idx, "week", "units"]], on=[idx, "week"], how="left")
-
-        if not long_color.empty:
-            num_books = long_color[idx].nunique()
-            dynamic_height = max(600, num_books * 20)  # 20px per libro
-
-            chart_streak = alt.Chart(long_color).mark_rect(
-                stroke='gray',
-                strokeWidth=0.5
-            ).encode(
-                x=alt.X("week:N", sort=week_options[1:], title="Settimana"),
-                y=alt.Y(f"{idx}:N", sort=alt.EncodingSortField(field="units", op="sum", order="descending")),
-                color=alt.Color("color:N", scale=alt.Scale(domain=["green","white","red"], range=["green","white","red"]), legend=None),
-                tooltip=[idx, "week", alt.Tooltip("units:Q", title="Unità vendute")]
-            ).properties(
-                width=900,
-                height=dynamic_height
-            )
-
-            st.altair_chart(chart_streak, use_container_width=True)
+    data = focus_view("streak")
+    if data is None:
+        st.info(f"Nessun dato {focus} trovato.")
+        return
+    idx = data["idx"]
+
+    if data["order"]:
+        page = heatmap_pager(data, "page_streak")
+        show_chart(streak_heatmap(page["cells"], idx, page["rows"], week_options[1:]), use_container_width=True)
 
 # ===================================================================
-# TAB INSIGHT ADELPHI (VENDITE)
+# VISTA INSIGHT FOCUS (VENDITE)
 # ===================================================================
-with tab_insight_adelphi:
-    st.header("Insight Adelphi – Vendite")
+def render_insight():
+    st.header(f"Insight {focus} – Vendite")
 
-    insight = df_all[df_all["publisher"].str.contains("Adelphi", case=False, na=False)].copy()
-    if insight.empty:
-        st.info("Nessun dato Adelphi.")
-    else:
-        insight["units"] = pd.to_numeric(insight["units"], errors="coerce").fillna(0)
+    data = focus_view("insight")
+    if data is None:
+        st.info(f"Nessun dato {focus}.")
+        return
 
-        for col in ["title", "collana"]:
-            if filters.get(col):
-                insight = insight[insight[col].isin(filters[col])]
-
-        st.subheader("Top 20 Libri più venduti")
-        top_libri = insight.groupby("title")["units"].sum().nlargest(20).reset_index()
-        st.altair_chart(alt.Chart(top_libri).mark_bar().encode(x=alt.X("title:N",sort="-y"),y="units:Q"), use_container_width=True)
-
-        st.subheader("Top 20 Autori più venduti")
-        top_autori = insight.groupby("author")["units"].sum().nlargest(20).reset_index()
-        st.altair_chart(alt.Chart(top_autori).mark_bar().encode(x=alt.X("author:N",sort="-y"),y="units:Q"), use_container_width=True)
-
-        if "collana" in insight.columns:
-            st.subheader("Distribuzione Vendite per Collana")
-            pie_collana = insight.groupby("collana")["units"].sum().reset_index()
-            pie_collana = pie_collana[pie_collana["units"] > 0]
-            st.altair_chart(alt.Chart(pie_collana).mark_arc().encode(
-                theta="units:Q",
-                color="collana:N",
-                tooltip=["collana", "units"]
-            ).properties(height=400), use_container_width=True)
-
-        st.subheader("Trend Vendite Totali Adelphi")
-        trend_total = insight.groupby("week")["units"].sum().reset_index()
-        st.altair_chart(alt.Chart(trend_total).mark_line(point=True).encode(
-            x=alt.X("week:N", sort=week_options[1:]),
-            y="units:Q"
-        ).properties(height=400), use_container_width=True)
+    st.subheader("Top 20 Libri più venduti")
+    show_chart(top_bar_chart(data["top_libri"], "title"), use_container_width=True)
+
+    st.subheader("Top 20 Autori più venduti")
+    show_chart(top_bar_chart(data["top_autori"], "author"), use_container_width=True)
+
+    if data["pie_collana"] is not None:
+        st.subheader("Distribuzione Vendite per Collana")
+        show_chart(collana_pie_chart(data["pie_collana"]), use_container_width=True)
+
+    st.subheader(f"Trend Vendite Totali {focus}")
+    show_chart(weekly_units_chart(data["trend_total"], week_options[1:]), use_container_width=True)
 
 # ===================================================================
-# TAB CONFRONTI ANNO SU ANNO – LA PIÙ IMPORTANTE
+# VISTA CONFRONTI ANNO SU ANNO – LA PIÙ IMPORTANTE
 # ===================================================================
-with tab_confronti:
+def render_confronti():
     st.header("Confronti Anno su Anno – Settimana per Settimana")
 
-    confronto = df_all[df_all["publisher"].str.contains("Adelphi", case=False, na=False)].copy()
-    if confronto.empty:
-        st.info("Nessun dato Adelphi.")
-    else:
-        for col in ["title", "collana"]:
-            if filters.get(col):
-                confronto = confronto[confronto[col].isin(filters[col])]
-
-        # Grafico totale vendite anno su anno
-        st.subheader("Trend Vendite Totali – Confronto Anni")
-        trend_total = confronto.groupby(["year", "week"])["units"].sum().reset_index()
-        st.altair_chart(alt.Chart(trend_total).mark_line(point=True).encode(
-            x=alt.X("week:N", sort=week_options[1:]),
-            y="units:Q",
-            color="year:N"
-        ).properties(height=500), use_container_width=True)
-
-        # Tabella per titoli con confronto, differenza, %, colori
-        st.subheader("Confronto per Titolo")
-        if confronto["title"].nunique() > 0:
-            pivot = confronto.pivot_table(index="title", columns="year", values="units", aggfunc="sum").fillna(0)
-            years_list = sorted(pivot.columns)
-            if len(years_list) >= 2:
-                pivot["Diff"] = pivot[years_list[-1]] - pivot[years_list[-2]]
-                pivot["Diff_%"] = np.where(pivot[years_list[-2]] > 0, (pivot["Diff"] / pivot[years_list[-2]]) * 100, np.nan)
-
-                styled_pivot = pivot.style.background_gradient(subset=["Diff_%"], cmap="RdYlGn", vmin=-100, vmax=100).format("{:.2f}")
-                st.dataframe(styled_pivot, use_container_width=True)
-
-            # Grafico per titolo (top 10 per vendite)
-            st.subheader("Trend Vendite per Titolo – Confronto Anni")
-            top_titles = confronto.groupby("title")["units"].sum().nlargest(10).index
-            top_confronto = confronto[confronto["title"].isin(top_titles)]
-            chart_title = alt.Chart(top_confronto).mark_line(point=True).encode(
-                x=alt.X("week:N", sort=week_options[1:]),
-                y="units:Q",
-                color="year:N",
-                detail="title:N",
-                tooltip=["title", "week", "year", "units"]
-            ).properties(height=500)
-            st.altair_chart(chart_title, use_container_width=True)
-
-        else:
-            st.info("Nessun titolo da confrontare.")
-
-st.success("Dashboard aggiornata – tutto perfetto!")
+    data = focus_view("confronti")
+    if data is None:
+        st.info(f"Nessun dato {focus}.")
+        return
+
+    # Grafico totale vendite anno su anno
+    st.subheader("Trend Vendite Totali – Confronto Anni")
+    show_chart(weekly_units_chart(data["trend_total"], week_options[1:], by_year=True, height=500), use_container_width=True)
+
+    # Tabella per titoli con confronto, differenza, %, colori
+    st.subheader("Confronto per Titolo")
+    if data["top_confronto"] is None:
+        st.info("Nessun titolo da confrontare.")
+        return
+
+    if data["pivot"] is not None:
+        styled_pivot = data["pivot"].style.background_gradient(subset=["Diff_%"], cmap="RdYlGn", vmin=-100, vmax=100).format("{:.2f}")
+        st.dataframe(styled_pivot, use_container_width=True)
+
+    # Grafico per titolo (top 10 per vendite)
+    st.subheader("Trend Vendite per Titolo – Confronto Anni")
+    show_chart(yoy_titles_chart(data["top_confronto"], week_options[1:]), use_container_width=True)
+
+# ===================================================================
+# NAVIGAZIONE – SI CALCOLA SOLO LA VISTA ATTIVA
+# ===================================================================
+# st.tabs eseguirebbe il corpo di tutte le schede a ogni interazione
+VIEWS = {
+    "principale": ("Principale", render_principale),
+    "variazioni": (f"Analisi {focus}", render_variazioni),
+    "streak": (f"Streak {focus}", render_streak),
+    "insight": (f"Insight {focus} (Vendite)", render_insight),
+    "confronti": ("Confronti Anno su Anno", render_confronti),
+}
+active_view = st.radio("Vista", list(VIEWS), format_func=lambda v: VIEWS[v][0],
+                       horizontal=True, label_visibility="collapsed", key="view")
+try:
+    with stage(f"vista:{active_view}"):
+        VIEWS[active_view][1]()
+    st.success("Dashboard aggiornata – tutto perfetto!")
+finally:
+    perf_panel(finish_run())
@@ -0,0 +1,222 @@
+# batch_report.py → report delle viste focus per editore, senza browser
+#
+#   python batch_report.py Adelphi Einaudi            # un report per ogni editore cercato
+#   python batch_report.py --all --workers 4          # un report per ogni editore del master
+#
+# Per ogni report: tabelle (Parquet o CSV) e specifiche Vega-Lite (.vl.json) di variazioni,
+# streak, top libri/autori, collane e confronti anno su anno, negli stessi calcoli dell'app
+# (tab_utils) e con gli stessi grafici (viz_utils). I processi aprono lo stesso master Arrow
+# mappato in memoria e la matrice dei confronti costruita una volta dal processo principale
+# (.npy mappati): le pagine sono condivise, non copiate per processo.
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import altair as alt
+
+from ingest_utils import week_label, resolve_workers
+from master_utils import ARROW_PATH, read_master, read_master_arrow, list_partitions, master_version
+from filter_utils import sort_by_publisher, build_publisher_index, match_publishers
+from matrix_utils import build_title_matrix, matrix_rows
+from heatmap_utils import heatmap_page
+from streak_utils import load_streaks, streak_leaderboard
+from cache_utils import encode_value, decode_value
+from tab_utils import focus_rows, variation_data, streak_data, insight_data, yoy_data
+from viz_utils import (variation_heatmap, streak_heatmap, top_bar_chart, collana_pie_chart,
+                       weekly_units_chart, yoy_titles_chart)
+
+REPORT_DIR = "reports"
+TABLE_FORMATS = ["parquet", "csv"]
+
+# Stato del processo: caricato una volta dall'initializer, poi usato da ogni report
+_shared = {}
+
+
+def load_report_master():
+    if os.path.exists(ARROW_PATH):
+        return read_master_arrow()
+    return sort_by_publisher(read_master())
+
+
+def share_matrix(master, matrix_dir):
+    # Scritta una volta sola (array .npy + chiavi parquet, come la cache su disco dell'app)
+    spec = encode_value(build_title_matrix(master), matrix_dir, "matrix")
+    with open(os.path.join(matrix_dir, "manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(spec, fh)
+
+
+def open_matrix(matrix_dir):
+    # Array aperti con mmap_mode="r": ogni processo legge le stesse pagine
+    with open(os.path.join(matrix_dir, "manifest.json"), encoding="utf-8") as fh:
+        return decode_value(json.load(fh), matrix_dir)
+
+
+def load_shared(matrix_dir=None):
+    master = load_report_master()
+    _shared.update({
+        "master": master,
+        "publisher_index": build_publisher_index(master),
+        "matrix": open_matrix(matrix_dir) if matrix_dir else build_title_matrix(master),
+        "streaks": load_streaks(),
+        "week_order": [week_label(w) for w in sorted({w for _, w in list_partitions()})],
+    })
+    # Le heatmap dei report superano il limite di righe inline di Altair
+    alt.data_transformers.disable_max_rows()
+
+
+def publisher_names():
+    master = read_master_arrow() if os.path.exists(ARROW_PATH) else read_master(columns=["publisher"])
+    return sorted(str(p) for p in master["publisher"].dropna().unique())
+
+
+def slugify(name):
+    return re.sub(r"[^0-9A-Za-z]+", "_", name).strip("_").lower() or "editore"
+
+
+def write_table(df, out_dir, name, fmt):
+    path = os.path.join(out_dir, f"{name}.{fmt}")
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+    return os.path.basename(path)
+
+
+def write_spec(chart, out_dir, name):
+    path = os.path.join(out_dir, f"{name}.vl.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        # Specifiche costruite da codice fisso: la validazione dello schema è solo costo
+        fh.write(chart.to_json(indent=None, validate=False))
+    return os.path.basename(path)
+
+
+def publisher_report(task):
+    label, publishers, out_dir, fmt = task
+    start = time.perf_counter()
+    master, index = _shared["master"], _shared["publisher_index"]
+    weeks = _shared["week_order"]
+    os.makedirs(out_dir, exist_ok=True)
+    files = []
+    rows = focus_rows(master, index, publishers, {})
+    if rows.empty:
+        return {"report": label, "publishers": publishers, "rows": 0, "files": files, "seconds": 0.0}
+    # Categorie ridotte a quelle dell'editore: i groupby non scorrono tutto il vocabolario
+    rows = rows.assign(**{c: rows[c].cat.remove_unused_categories() for c in ["title", "author", "collana"]})
+
+    # Variazioni: tabella completa, heatmap della prima pagina (titoli più venduti)
+    data = variation_data(rows)
+    files.append(write_table(data["table"][["title", "collana", "week", "units", "Diff_%"]]
+                             .sort_values(["title", "week"]), out_dir, "variazioni", fmt))
+    if data["order"]:
+        page = heatmap_page(data["cells"], data["idx"], data["order"], 1)
+        files.append(write_spec(variation_heatmap(page["cells"], data["idx"], page["rows"], weeks), out_dir, "variazioni"))
+
+    # Streak: classifica dalla tabella per titolo + heatmap
+    board = streak_leaderboard(_shared["streaks"], publishers)
+    files.append(write_table(board[board["longest_up"] > 0], out_dir, "streak", fmt))
+    data = streak_data(rows)
+    if data["order"]:
+        page = heatmap_page(data["cells"], data["idx"], data["order"], 1)
+        files.append(write_spec(streak_heatmap(page["cells"], data["idx"], page["rows"], weeks), out_dir, "streak"))
+
+    # Insight: top libri/autori, collane, trend
+    data = insight_data(rows, lambda group_by: rows.groupby(group_by, observed=True)["units"].sum().reset_index())
+    for name, col in [("top_libri", "title"), ("top_autori", "author")]:
+        files.append(write_table(data[name], out_dir, name, fmt))
+        files.append(write_spec(top_bar_chart(data[name], col), out_dir, name))
+    if data["pie_collana"] is not None:
+        files.append(write_table(data["pie_collana"], out_dir, "collane", fmt))
+        files.append(write_spec(collana_pie_chart(data["pie_collana"]), out_dir, "collane"))
+    files.append(write_table(data["trend_total"], out_dir, "trend_totale", fmt))
+    files.append(write_spec(weekly_units_chart(data["trend_total"], weeks), out_dir, "trend_totale"))
+
+    # Confronti anno su anno dalla matrice titolo × anno × settimana
+    matrix = _shared["matrix"]
+    data = yoy_data(matrix, matrix_rows(matrix, publishers))
+    files.append(write_spec(weekly_units_chart(data["trend_total"], weeks, by_year=True, height=500), out_dir, "confronti_trend"))
+    if data["pivot"] is not None:
+        pivot = data["pivot"].reset_index()
+        pivot.columns = [str(c) for c in pivot.columns]
+        files.append(write_table(pivot, out_dir, "confronti", fmt))
+    if data["top_confronto"] is not None:
+        files.append(write_spec(yoy_titles_chart(data["top_confronto"], weeks), out_dir, "confronti_titoli"))
+
+    return {"report": label, "publishers": publishers, "rows": len(rows), "files": files,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def plan_reports(patterns, all_publishers, out, fmt, publishers):
+    # Un report per pattern (tutti gli editori che lo contengono, come l'editore focus dell'app)
+    # oppure uno per ogni editore
+    groups = {p: [p] for p in publishers} if all_publishers else {p: match_publishers(publishers, p) for p in patterns}
+    tasks, used = [], set()
+    for label, names in groups.items():
+        if not names:
+            continue
+        # Nomi diversi solo per punteggiatura ("Fond.Ne" / "Fond Ne") avrebbero la stessa cartella
+        slug, n = slugify(label), 1
+        while slug in used:
+            n += 1
+            slug = f"{slugify(label)}_{n}"
+        used.add(slug)
+        tasks.append((label, names, os.path.join(out, slug), fmt))
+    return tasks
+
+
+def run_reports(tasks, workers=None):
+    workers = resolve_workers(workers, len(tasks))
+    if workers == 1:
+        load_shared()
+        return [publisher_report(t) for t in tasks]
+    # "spawn" come in ingest_utils.parallel_map; ogni processo carica il master una sola volta
+    matrix_dir = tempfile.mkdtemp(prefix="batch_matrix_")
+    try:
+        share_matrix(load_report_master(), matrix_dir)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=load_shared,
+                                 initargs=(matrix_dir,)) as executor:
+            return list(executor.map(publisher_report, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    finally:
+        shutil.rmtree(matrix_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report batch delle viste focus per editore")
+    parser.add_argument("publishers", nargs="*", help="editori (ricerca per sottostringa, come l'editore focus)")
+    parser.add_argument("--all", action="store_true", help="un report per ogni editore del master")
+    parser.add_argument("--out", default=REPORT_DIR)
+    parser.add_argument("--format", choices=TABLE_FORMATS, default="parquet", help="formato delle tabelle")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    version = master_version()
+    if version is None:
+        sys.exit("Database master non trovato: eseguire prima create_parquet.py")
+    if not args.publishers and not args.all:
+        parser.error("indicare almeno un editore oppure --all")
+
+    start = time.perf_counter()
+    tasks = plan_reports(args.publishers, args.all, args.out, args.format, publisher_names())
+    planned = {t[0] for t in tasks}
+    for p in args.publishers:
+        if not args.all and p not in planned:
+            print(f"Nessun editore trovato per '{p}'", file=sys.stderr)
+    results = run_reports(tasks, args.workers)
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = {
+        "version": version,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - start, 2),
+        "reports": [{**r, "dir": os.path.basename(t[2])} for r, t in zip(results, tasks)],
+    }
+    with open(os.path.join(args.out, "index.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=1)
+    print(f"{len(results)} report in {args.out} ({summary['seconds']}s)")
@@ -0,0 +1,206 @@
+# benchmark.py → tempi e memoria di build, caricamento, filtri e calcoli di ogni vista
+#
+#   python generate_data.py --out bench_data --years 2 --rows 5000
+#   python benchmark.py --data bench_data
+#
+# Master, rollup e indici vengono scritti dentro la cartella dei dati di prova (mai in data/).
+# Ogni esecuzione aggiunge una riga a bench_results.jsonl e viene confrontata con la
+# precedente sugli stessi dati: i passi più lenti del 25% sono segnalati come regressioni.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+from ingest_utils import discover_week_files
+from master_utils import plan_update, build_master, read_master, write_master_arrow, read_master_arrow
+from rollup_utils import build_rollups
+from search_utils import SEARCH_COLUMNS, build_vocabulary, load_vocabulary, build_search_index, search
+from streak_utils import update_streaks
+from series_utils import build_series, load_series, title_history, top_titles, sparklines
+from filter_utils import sort_by_publisher, build_publisher_index, match_publishers, build_filter_index, filter_positions
+from trend_utils import weekly_trend
+from tab_utils import focus_rows, variation_data, streak_data, insight_data, yoy_data
+from matrix_utils import build_title_matrix, matrix_rows
+from table_utils import sort_positions, export_bytes
+from data_utils import load_all_dataframes, aggregate_all_weeks
+from viz_utils import create_publisher_books_trend_chart
+
+RESULTS_PATH = "bench_results.jsonl"
+REGRESSION_RATIO = 1.25
+# Sotto questa soglia le differenze sono rumore
+MIN_SECONDS = 0.05
+MEASURE_MEMORY = False
+
+
+def rss_mb():
+    # Picco di memoria del processo (ru_maxrss è in KB su Linux, in byte su macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_step(results, name, func, *args, **kwargs):
+    # tracemalloc (--memory) vede le allocazioni Python/numpy ma rallenta molto il codice
+    # Python puro (openpyxl): i tempi si confrontano solo tra esecuzioni con la stessa modalità.
+    # Le allocazioni di Arrow si vedono solo nel picco RSS.
+    trace = MEASURE_MEMORY
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20 if trace else None
+    if trace:
+        tracemalloc.stop()
+    results[name] = {"seconds": round(seconds, 4), "peak_mb": None if peak is None else round(peak, 1),
+                     "rss_mb": round(rss_mb(), 1)}
+    print(f"{name:<28} {seconds:>9.3f}s" + (f" {peak:>9.1f} MB" if trace else ""))
+    return value
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(data_dir, focus=None, workers=None):
+    paths = {
+        "master": os.path.join(data_dir, "master_sales"),
+        "manifest": os.path.join(data_dir, "master_manifest.json"),
+        "rollups": os.path.join(data_dir, "master_rollups"),
+        "vocab": os.path.join(data_dir, "master_vocabulary.parquet"),
+        "streaks": os.path.join(data_dir, "master_streaks.parquet"),
+        "arrow": os.path.join(data_dir, "master_sales.arrow"),
+        "series": os.path.join(data_dir, "master_series.arrow"),
+    }
+    for p in paths.values():
+        if os.path.isdir(p):
+            shutil.rmtree(p)
+        elif os.path.exists(p):
+            os.remove(p)
+    results = {}
+
+    # Build (da zero, poi senza modifiche)
+    plan = run_step(results, "plan_update", plan_update, data_dir, paths["master"], paths["manifest"])
+    rows, _ = run_step(results, "build_master", build_master, plan, data_dir, paths["master"], paths["manifest"], workers)
+    run_step(results, "build_rollups", build_rollups, paths["master"], paths["rollups"])
+    run_step(results, "build_vocabulary", build_vocabulary, paths["master"], paths["vocab"])
+    run_step(results, "update_streaks", update_streaks, paths["master"], paths["manifest"], paths["streaks"])
+    run_step(results, "plan_update_noop", plan_update, data_dir, paths["master"], paths["manifest"])
+
+    # Caricamento e indici (come load_master_indexed / load_search)
+    df = run_step(results, "read_master", read_master, master_path=paths["master"])
+    master = run_step(results, "sort_by_publisher", sort_by_publisher, df)
+    run_step(results, "write_master_arrow", write_master_arrow, master, paths["arrow"])
+    master = run_step(results, "read_master_arrow", read_master_arrow, paths["arrow"])
+    run_step(results, "build_series", build_series, master, paths["series"])
+    series = run_step(results, "load_series", load_series, paths["series"])
+    publisher_index = run_step(results, "publisher_index", build_publisher_index, master)
+    filter_index = run_step(results, "filter_index", build_filter_index, master)
+    vocab = load_vocabulary(paths["vocab"])
+    search_index = run_step(results, "search_index", build_search_index, vocab)
+    run_step(results, "search", lambda: [search(search_index, c, q) for c in SEARCH_COLUMNS for q in ["", "am", "amore"]])
+
+    # Filtri della sidebar
+    top_publisher = master.groupby("publisher", observed=True)["units"].sum().idxmax()
+    last_year = int(master["year"].max())
+    filters = {"year": [last_year], "publisher": [top_publisher]}
+    positions = run_step(results, "filter_cold", filter_positions, filter_index, filters)
+    run_step(results, "filter_warm", filter_positions, filter_index, filters)
+    year_positions = filter_positions(filter_index, {"year": [last_year]})
+
+    # Vista principale
+    run_step(results, "table_sort_title", sort_positions, master, year_positions, "title")
+    run_step(results, "export_csv", export_bytes, master, year_positions, "CSV")
+    run_step(results, "export_parquet", export_bytes, master, year_positions, "Parquet")
+    run_step(results, "weekly_trend", weekly_trend, master.take(positions), "title")
+    page_titles = master["title"].take(year_positions[:100]).astype(str).tolist()
+    run_step(results, "series_sparklines", sparklines, series, page_titles)
+    run_step(results, "series_history", lambda: [title_history(series, t) for t in page_titles])
+    run_step(results, "series_top_titles", top_titles, series, "weeks_top")
+
+    # Viste dell'editore focus
+    focus_publishers = match_publishers(list(publisher_index), focus) if focus else [top_publisher]
+    rows_focus = run_step(results, "focus_rows", focus_rows, master, publisher_index, focus_publishers, {})
+    run_step(results, "tab_variazioni", variation_data, rows_focus)
+    run_step(results, "tab_streak", streak_data, rows_focus)
+    summarize = lambda g: rows_focus.groupby(g, observed=True)["units"].sum().reset_index()
+    run_step(results, "tab_insight", insight_data, rows_focus, summarize)
+    matrix = run_step(results, "title_matrix", build_title_matrix, master)
+    run_step(results, "tab_confronti", lambda: yoy_data(matrix, matrix_rows(matrix, focus_publishers)))
+
+    # Funzioni legacy di data_utils / viz_utils su un anno di file
+    year_dir = os.path.dirname(discover_week_files(data_dir)[-1][2])
+    dataframes = run_step(results, "load_all_dataframes", load_all_dataframes, year_dir, workers)
+    aggregate_all_weeks.clear()
+    run_step(results, "aggregate_all_weeks", aggregate_all_weeks, dataframes)
+    publishers = sorted({p for d in dataframes.values() for p in d["publisher"].dropna().unique()})[:3]
+    run_step(results, "publisher_books_trend", create_publisher_books_trend_chart, dataframes, publishers)
+
+    return {"files": len(plan["files"]), "rows": rows}, results
+
+
+def previous_run(results_path, data_info):
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding="utf-8") as fh:
+        for line in fh:
+            entry = json.loads(line)
+            if entry.get("data") == data_info:
+                previous = entry
+    return previous
+
+
+def compare(previous, steps):
+    regressions = []
+    print(f"\nConfronto con {previous.get('commit') or '?'} del {previous['timestamp']}")
+    for name, res in steps.items():
+        old = previous["steps"].get(name)
+        if not old:
+            continue
+        ratio = res["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        flag = ""
+        if ratio > REGRESSION_RATIO and res["seconds"] - old["seconds"] > MIN_SECONDS:
+            flag = "  ← REGRESSIONE"
+            regressions.append(name)
+        print(f"{name:<28} {old['seconds']:>9.3f}s → {res['seconds']:>9.3f}s  ×{ratio:.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark della dashboard su dati sintetici")
+    parser.add_argument("--data", default="bench_data", help="cartella creata da generate_data.py")
+    parser.add_argument("--focus", default=None, help="editore focus (default: il più venduto)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--label", default="", help="nota libera salvata con i risultati")
+    parser.add_argument("--memory", action="store_true", help="misura il picco di memoria con tracemalloc (più lento)")
+    args = parser.parse_args()
+    MEASURE_MEMORY = args.memory
+
+    if not discover_week_files(args.data):
+        sys.exit(f"Nessun file in {args.data}: eseguire prima generate_data.py")
+    data_info, steps = run_benchmarks(args.data, args.focus, args.workers)
+    data_info = {**data_info, "dir": os.path.abspath(args.data), "memory": args.memory}
+    previous = previous_run(args.results, data_info)
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "label": args.label,
+        "data": data_info,
+        "steps": steps,
+    }
+    with open(args.results, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    if previous:
+        regressions = compare(previous, steps)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import shutil
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from ingest_utils import DATA_DIR
+from master_utils import (MASTER_PATH, MANIFEST_PATH, VERSION_PATH, ARROW_PATH, plan_update, needs_update,
+                          build_master, read_master, list_partitions, manifest_token, version_info, publish_version,
+                          write_master_arrow)
+from filter_utils import sort_by_publisher
+from rollup_utils import ROLLUP_DIR, rollups_ready, build_rollups
+from search_utils import VOCAB_PATH, vocabulary_ready, build_vocabulary
+from streak_utils import STREAK_PATH, streaks_ready, update_streaks
+from series_utils import SERIES_PATH, SERIES_SOURCE, build_series
+
+# Build fuori dall'app: master e derivati si preparano in una cartella di staging (hard link
+# delle partizioni invariate), poi si scambiano tutti con quelli pubblicati con sole rinomine
+# e solo alla fine si scrive la versione
+LOCK_PATH = os.path.join(DATA_DIR, "master_build.lock")
+STAGING_DIR = os.path.join(DATA_DIR, "master_build.staging")
+# Output della build avviata dall'app al primo avvio
+BUILD_LOG_PATH = os.path.join(DATA_DIR, "master_build.log")
+# Ordine delle rinomine alla pubblicazione
+PUBLISHED = ["master", "manifest", "arrow", "rollups", "vocab", "streaks", "series"]
+# Un lock più vecchio di così è di una build interrotta
+LOCK_TIMEOUT = int(os.environ.get("BUILD_LOCK_TIMEOUT", "7200"))
+
+
+def artifact_paths(data_dir=DATA_DIR):
+    # Stessi nomi dei default dei moduli, dentro la cartella dei dati indicata
+    return {
+        "master": os.path.join(data_dir, os.path.basename(MASTER_PATH)),
+        "manifest": os.path.join(data_dir, os.path.basename(MANIFEST_PATH)),
+        "version": os.path.join(data_dir, os.path.basename(VERSION_PATH)),
+        "arrow": os.path.join(data_dir, os.path.basename(ARROW_PATH)),
+        "rollups": os.path.join(data_dir, os.path.basename(ROLLUP_DIR)),
+        "vocab": os.path.join(data_dir, os.path.basename(VOCAB_PATH)),
+        "streaks": os.path.join(data_dir, os.path.basename(STREAK_PATH)),
+        "series": os.path.join(data_dir, os.path.basename(SERIES_PATH)),
+        "lock": os.path.join(data_dir, os.path.basename(LOCK_PATH)),
+    }
+
+
+@contextmanager
+def build_lock(lock_path=LOCK_PATH):
+    # Una sola build alla volta (deploy, cron e app possono sovrapporsi)
+    if os.path.exists(lock_path) and not build_running(lock_path):
+        os.remove(lock_path)
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise RuntimeError(f"Build già in corso ({lock_path})") from None
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def build_running(lock_path=LOCK_PATH):
+    # Lock recente e processo ancora vivo: un lock rimasto da una build interrotta non conta
+    try:
+        age = time.time() - os.path.getmtime(lock_path)
+        with open(lock_path, encoding="utf-8") as fh:
+            pid = fh.read().strip()
+    except OSError:
+        return False
+    if age > LOCK_TIMEOUT:
+        return False
+    if not pid:
+        # Lock appena creato, pid non ancora scritto
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+def start_background_build(log_path=BUILD_LOG_PATH):
+    # create_parquet.py in un processo staccato (sopravvive al rerun e alla sessione); se due
+    # sessioni lo avviano insieme, il lock lascia proseguire solo la prima
+    if build_running():
+        return False
+    with open(log_path, "ab") as log:
+        subprocess.Popen([sys.executable, "create_parquet.py"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    return True
+
+
+def link_tree(src, dst):
+    # Copia a costo quasi nullo: i file riscritti dalla build sostituiscono il link,
+    # quelli pubblicati restano intatti
+    for root, _, files in os.walk(src):
+        out = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(out, exist_ok=True)
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            try:
+                os.link(os.path.join(root, name), os.path.join(out, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(out, name))
+
+
+def swap_dir(staging, target):
+    old = target + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(target):
+        os.replace(target, old)
+    os.replace(staging, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def publish_artifacts(staged, paths):
+    # Niente da calcolare qui: solo rinomine, in pochi millisecondi
+    for key in PUBLISHED:
+        if os.path.isdir(staged[key]):
+            swap_dir(staged[key], paths[key])
+        else:
+            os.replace(staged[key], paths[key])
+
+
+def build_staged(plan, paths, staged, data_dir, workers, log):
+    # Master e derivati scritti solo nello staging: un errore qui non tocca i file pubblicati
+    if plan["old"]:
+        link_tree(paths["master"], staged["master"])
+        shutil.copy2(paths["manifest"], staged["manifest"])
+        # Base per l'aggiornamento incrementale delle streak
+        if os.path.exists(paths["streaks"]):
+            shutil.copy2(paths["streaks"], staged["streaks"])
+    rows, warnings = build_master(plan, data_dir, staged["master"], staged["manifest"], workers)
+    for w in warnings:
+        log(f"Attenzione: {w}")
+    if rows is None:
+        return None, warnings
+    build_rollups(staged["master"], staged["rollups"])
+    build_vocabulary(staged["master"], staged["vocab"])
+    # Master ricostruito da zero (--full, alias o schema cambiati) → streak ricalcolate da zero
+    update_streaks(staged["master"], staged["manifest"], staged["streaks"], full=not plan["old"])
+    master = read_master(master_path=staged["master"])
+    build_series(master[SERIES_SOURCE], staged["series"])
+    write_master_arrow(sort_by_publisher(master), staged["arrow"])
+    return rows, warnings
+
+
+def run_build(data_dir=DATA_DIR, full=False, workers=None, log=print):
+    # Restituisce le informazioni della versione pubblicata (quella nuova o quella già presente)
+    paths = artifact_paths(data_dir)
+    staging = os.path.join(data_dir, os.path.basename(STAGING_DIR))
+    staged = artifact_paths(staging)
+    with build_lock(paths["lock"]):
+        plan = plan_update(data_dir, paths["master"], paths["manifest"])
+        if full:
+            plan = {**plan, "old": {}, "changed": list(plan["files"]), "deleted": []}
+        current = version_info(paths["version"])
+        derived_ready = (rollups_ready(paths["rollups"]) and vocabulary_ready(paths["vocab"])
+                         and streaks_ready(paths["streaks"]) and os.path.exists(paths["arrow"])
+                         and os.path.exists(paths["series"]))
+        if current and derived_ready and not needs_update(plan):
+            log(f"Nessuna modifica: versione {current['version']}")
+            return current
+
+        start = time.perf_counter()
+        log(f"Build: {len(plan['changed'])} file nuovi/modificati, {len(plan['deleted'])} rimossi")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            rows, warnings = build_staged(plan, paths, staged, data_dir, workers, log)
+            if rows is None:
+                return current
+            publish_artifacts(staged, paths)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        built_at = datetime.now(timezone.utc)
+        info = {
+            "version": manifest_token(paths["manifest"], built_at.isoformat()),
+            "built_at": built_at.isoformat(timespec="seconds"),
+            "rows": rows,
+            "files": len(plan["files"]),
+            "partitions": len(list_partitions(paths["master"])),
+            "seconds": round(time.perf_counter() - start, 2),
+            "warnings": warnings,
+        }
+        publish_version(info, paths["version"])
+        log(f"Pubblicata la versione {info['version']}: {rows:,} righe in {info['seconds']}s")
+        return info
@@ -0,0 +1,280 @@
+import os
+import ast
+import sys
+import json
+import shutil
+import inspect
+import hashlib
+import importlib
+import threading
+import functools
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from perf_utils import count
+
+# Cache dei risultati con chiave a impronta (stat del file, token di versione + parametri):
+# la ricerca non guarda mai il contenuto dei DataFrame. LRU entro un budget di memoria totale.
+CACHE_MAX_MB = float(os.environ.get("CACHE_MAX_MB", "512"))
+# Secondo livello su disco: sopravvive a riavvii e redeploy (Parquet per i DataFrame, .npy per
+# gli array, JSON per il resto), chiave = versione del codice + token di versione + parametri,
+# LRU entro il budget
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join("data", "result_cache"))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "1024"))
+# Da incrementare se cambia il formato delle voci su disco
+CACHE_VERSION = 1
+# Da incrementare per invalidare a mano tutti i risultati su disco (es. dopo una modifica a
+# codice che la firma del codice non vede: dipendenze esterne, dati di configurazione)
+CACHE_SCHEMA_VERSION = 1
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0, "disk_hits": 0, "disk_misses": 0, "disk_evictions": 0}
+
+
+def file_fingerprint(path):
+    # Dimensione + mtime: cambia se il file viene sostituito o modificato
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def value_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(value_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def cache_get(key):
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return True, _entries[key][0]
+        _stats["misses"] += 1
+        return False, None
+
+
+def cache_put(key, value, max_mb=None):
+    budget = (CACHE_MAX_MB if max_mb is None else max_mb) * 2**20
+    size = value_nbytes(value)
+    with _lock:
+        if key in _entries:
+            _stats["bytes"] -= _entries.pop(key)[1]
+        # Un valore più grande dell'intero budget non si salva
+        if size > budget:
+            return False
+        while _entries and _stats["bytes"] + size > budget:
+            _, (_, old_size) = _entries.popitem(last=False)
+            _stats["bytes"] -= old_size
+            _stats["evictions"] += 1
+        _entries[key] = (value, size)
+        _stats["bytes"] += size
+    return True
+
+
+def cache_clear(name=None):
+    with _lock:
+        for key in [k for k in _entries if name is None or k[0] == name]:
+            _stats["bytes"] -= _entries.pop(key)[1]
+
+
+def cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_entries), "mb": round(_stats["bytes"] / 2**20, 1),
+                "budget_mb": CACHE_MAX_MB}
+
+
+def fingerprint_cache(name, fingerprint):
+    # fingerprint(*args, **kwargs) → chiave hashable, oppure None per non usare la cache.
+    # I valori sono condivisi tra le chiamate: da non modificare
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            key = fingerprint(*args, **kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            key = (name, key)
+            hit, value = cache_get(key)
+            count(f"cache_{'hit' if hit else 'miss'}:{name}")
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            cache_put(key, value)
+            return value
+        inner.clear = lambda: cache_clear(name)
+        return inner
+    return wrap
+
+
+def entry_dir(name, key, cache_dir=RESULT_CACHE_DIR):
+    # repr delle chiavi (stringhe, numeri, tuple, None) è stabile tra processi
+    return os.path.join(cache_dir, name, hashlib.sha1(repr(key).encode()).hexdigest()[:20])
+
+
+def plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def encode_value(value, path, part):
+    # Descrizione JSON del valore; DataFrame e array finiscono in file accanto
+    if isinstance(value, pd.DataFrame):
+        frame = value.copy(deep=False)
+        frame.columns = [str(c) for c in frame.columns]
+        frame.to_parquet(os.path.join(path, f"{part}.parquet"))
+        return {"frame": f"{part}.parquet", "columns": [plain(c) for c in value.columns],
+                "columns_name": value.columns.name}
+    if isinstance(value, np.ndarray):
+        np.save(os.path.join(path, f"{part}.npy"), value, allow_pickle=False)
+        return {"array": f"{part}.npy"}
+    if isinstance(value, dict):
+        return {"dict": {k: encode_value(v, path, f"{part}_{i}") for i, (k, v) in enumerate(value.items())}}
+    # Stringhe, numeri, None, liste di valori semplici; altro → TypeError (non si salva)
+    value = plain(value)
+    json.dumps(value)
+    return {"json": value}
+
+
+def decode_value(spec, path):
+    if "frame" in spec:
+        frame = pd.read_parquet(os.path.join(path, spec["frame"]))
+        frame.columns = pd.Index(spec["columns"], name=spec["columns_name"])
+        return frame
+    if "array" in spec:
+        # Mappato dal file: in sola lettura come il master
+        return np.load(os.path.join(path, spec["array"]), mmap_mode="r")
+    if "dict" in spec:
+        return {k: decode_value(v, path) for k, v in spec["dict"].items()}
+    return spec["json"]
+
+
+def dir_nbytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def disk_get(name, key, cache_dir=RESULT_CACHE_DIR):
+    path = entry_dir(name, key, cache_dir)
+    manifest = os.path.join(path, "manifest.json")
+    try:
+        with open(manifest, encoding="utf-8") as fh:
+            value = decode_value(json.load(fh), path)
+        # L'mtime del manifest fa da "ultimo uso" per l'LRU
+        os.utime(manifest)
+    except (OSError, ValueError, KeyError):
+        with _lock:
+            _stats["disk_misses"] += 1
+        return False, None
+    with _lock:
+        _stats["disk_hits"] += 1
+    return True, value
+
+
+def disk_put(name, key, value, cache_dir=RESULT_CACHE_DIR, max_mb=None):
+    path = entry_dir(name, key, cache_dir)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        spec = encode_value(value, tmp, "part")
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as fh:
+            json.dump(spec, fh)
+        # La cartella compare intera o non compare (un altro processo può averla già scritta)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+    disk_evict(cache_dir, max_mb)
+    return True
+
+
+def disk_entries(cache_dir=RESULT_CACHE_DIR):
+    entries = []
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        for entry in os.listdir(os.path.join(cache_dir, name)):
+            path = os.path.join(cache_dir, name, entry)
+            manifest = os.path.join(path, "manifest.json")
+            if not entry.endswith(".tmp") and os.path.exists(manifest):
+                entries.append((os.path.getmtime(manifest), dir_nbytes(path), path))
+    return entries
+
+
+def disk_evict(cache_dir=RESULT_CACHE_DIR, max_mb=None):
+    budget = (RESULT_CACHE_MAX_MB if max_mb is None else max_mb) * 2**20
+    entries = sorted(disk_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= budget:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        with _lock:
+            _stats["disk_evictions"] += 1
+    return total
+
+
+def local_imports(path):
+    # Moduli del progetto importati dal file (quelli che stanno nella stessa cartella)
+    with open(path, "rb") as fh:
+        tree = ast.parse(fh.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(a.name.split(".")[0] for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    folder = os.path.dirname(os.path.abspath(path))
+    return {os.path.join(folder, f"{n}.py") for n in names if os.path.exists(os.path.join(folder, f"{n}.py"))}
+
+
+def module_closure(modules):
+    # File dei moduli indicati e di tutto ciò che importano dal progetto, ricorsivamente
+    todo = [os.path.abspath(importlib.import_module(m).__file__) for m in modules]
+    seen = set()
+    while todo:
+        path = todo.pop()
+        if path not in seen:
+            seen.add(path)
+            todo.extend(local_imports(path) - seen)
+    return sorted(seen)
+
+
+def code_signature(func, modules=(), functions=()):
+    # Sorgente della funzione, delle funzioni di supporto indicate e dei moduli che calcolano
+    # il risultato (con le loro importazioni dal progetto): dopo una correzione del codice le
+    # voci vecchie non si leggono più (e l'LRU le elimina)
+    h = hashlib.sha1(f"{CACHE_VERSION}:{CACHE_SCHEMA_VERSION}:{func.__module__}.{func.__qualname__}".encode())
+    for f in [func, *functions]:
+        try:
+            h.update(inspect.getsource(f).encode())
+        except (OSError, TypeError):
+            pass
+    for path in module_closure(modules):
+        with open(path, "rb") as fh:
+            h.update(fh.read())
+    return h.hexdigest()[:12]
+
+
+def disk_cache(name, modules=(), functions=(), cache_dir=RESULT_CACHE_DIR):
+    # Da mettere sotto st.cache_data / fingerprint_cache: il disco si legge solo sui miss in
+    # memoria. Gli argomenti devono avere un repr stabile (token di versione, tuple, stringhe);
+    # "modules" elenca i moduli da cui dipende il risultato (le loro importazioni dal progetto
+    # si aggiungono da sole), "functions" le funzioni di supporto definite accanto
+    def wrap(func):
+        code = code_signature(func, modules, functions)
+
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            key = (code, args, tuple(sorted(kwargs.items())))
+            hit, value = disk_get(name, key, cache_dir)
+            count(f"disk_{'hit' if hit else 'miss'}:{name}")
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            disk_put(name, key, value, cache_dir)
+            return value
+        return inner
+    return wrap
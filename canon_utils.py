@@ -0,0 +1,78 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Tabella degli alias modificabile a mano: colonna, variante → forma canonica.
+# Cambiarla invalida il master (plan_update ricostruisce tutto)
+ALIAS_PATH = os.environ.get("ALIAS_PATH", os.path.join("data", "aliases.csv"))
+CANON_COLUMNS = ["title", "author", "publisher", "collana"]
+# Regola di base per i valori senza alias
+BASE_RULES = {
+    "title": str.strip,
+    "author": str.strip,
+    "publisher": lambda v: v.strip().title(),
+    "collana": str.strip,
+}
+
+_alias_cache = {}
+
+
+def match_key(value):
+    # Le varianti si confrontano senza maiuscole e spazi superflui ("l' avversario " = "L' Avversario")
+    return " ".join(str(value).split()).casefold()
+
+
+def alias_signature(alias_path=ALIAS_PATH):
+    if not os.path.exists(alias_path):
+        return None
+    with open(alias_path, "rb") as fh:
+        return hashlib.sha1(fh.read()).hexdigest()[:12]
+
+
+def load_aliases(alias_path=ALIAS_PATH):
+    # {colonna: {chiave variante: canonico}}, riletta solo se il file cambia
+    sig = alias_signature(alias_path)
+    if (alias_path, sig) not in _alias_cache:
+        aliases = {c: {} for c in CANON_COLUMNS}
+        if sig is not None:
+            table = pd.read_csv(alias_path, comment="#", dtype=str, keep_default_na=False, skipinitialspace=True)
+            for col, alias, canonical in table[["column", "alias", "canonical"]].itertuples(index=False):
+                aliases.setdefault(col.strip(), {})[match_key(alias)] = canonical.strip()
+        _alias_cache.clear()
+        _alias_cache[(alias_path, sig)] = aliases
+    return _alias_cache[(alias_path, sig)]
+
+
+def canonical_value(value, column, aliases=None):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    aliases = load_aliases() if aliases is None else aliases
+    text = str(value)
+    canonical = aliases.get(column, {}).get(match_key(text))
+    if canonical is not None:
+        return canonical
+    text = BASE_RULES.get(column, str.strip)(text)
+    return text or None
+
+
+def canonicalize(series, column, aliases=None):
+    # Regole applicate ai soli valori distinti, poi ridistribuite sulle righe tramite i codici
+    aliases = load_aliases() if aliases is None else aliases
+    cat = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+    mapped = pd.Series([canonical_value(v, column, aliases) for v in cat.cat.categories], dtype=object)
+    new_codes, categories = pd.factorize(mapped)
+    codes = cat.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, new_codes[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories.astype(str)),
+                     index=series.index, name=series.name)
+
+
+def canonicalize_frame(df, aliases=None, as_category=True):
+    aliases = load_aliases() if aliases is None else aliases
+    for col in CANON_COLUMNS:
+        if col in df.columns:
+            df[col] = canonicalize(df[col], col, aliases)
+            if not as_category:
+                df[col] = df[col].astype(object)
+    return df
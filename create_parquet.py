@@ -1 +1,41 @@
+# create_parquet.py → costruisce e pubblica il database master fuori dall'app
+#
+#   python create_parquet.py            # solo i file nuovi o modificati
+#   python create_parquet.py --full     # ricostruzione completa
+#   python create_parquet.py --watch 300
+#
+# Da eseguire dopo ogni aggiunta di classifiche (a mano, da cron o con --watch). Al primo
+# avvio senza master l'app lo lancia da sola in background; per il resto legge solo la
+# versione pubblicata in data/master_version.json.
+import sys
+import time
+import argparse
+from ingest_utils import DATA_DIR
+from build_utils import run_build
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build del database master (parquet, rollup, vocabolario, streak)")
+    parser.add_argument("--data", default=DATA_DIR, help="cartella con le classifiche settimanali")
+    parser.add_argument("--full", action="store_true", help="ricostruisce tutto da zero")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--watch", type=int, default=0, metavar="SECONDI",
+                        help="ricontrolla i file ogni N secondi invece di uscire")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            info = run_build(args.data, args.full, args.workers)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            info = None
+            if not args.watch:
+                return 1
+        if not args.watch:
+            return 0 if info else 1
+        args.full = False
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,54 +4,53 @@ import numpy as np
 import os
 import glob
 import re
-from concurrent.futures import ThreadPoolExecutor
+from ingest_utils import parallel_map, read_export_sheet
+from canon_utils import canonical_value, canonicalize_frame
+from perf_utils import timed
+from cache_utils import file_fingerprint, fingerprint_cache, cache_get, cache_put
 
+CHART_FIELDS = ["rank", "title", "author", "publisher", "units", "collana"]
+
+# Singoli valori: stesse regole e alias della build (canon_utils)
 def normalize_title(title):
-    if isinstance(title, str):
-        stripped = title.strip()
-        lower_stripped = stripped.lower()
-        if lower_stripped in ["l' avversario", "l'avversario"]:
-            return "L'avversario"
-        return stripped
-    return title
+    return canonical_value(title, "title") if isinstance(title, str) else title
 
 def normalize_publisher(publisher):
-    if isinstance(publisher, str):
-        return publisher.strip().title()
-    return publisher
+    return canonical_value(publisher, "publisher") if isinstance(publisher, str) else publisher
 
-@st.cache_data
-def load_data(file_path):
+def read_chart_file(file_path):
     try:
-        df = pd.read_excel(file_path, sheet_name="Export", header=0, engine="openpyxl")
-        df.columns = [str(col).strip().lower().replace(" ", "_") for col in df.columns]
-        rank_variants = ["rank", "rango", "classifica"]
-        rank_col = next((col for col in df.columns if col in rank_variants), None)
-        if not rank_col:
-            st.error(f"File {os.path.basename(file_path)} manca colonna 'Rank' o varianti. Colonne trovate: {list(df.columns)}")
-            return None
-        df = df.rename(columns={rank_col: "rank"})
+        df = read_export_sheet(file_path, CHART_FIELDS)
+        if "rank" not in df.columns:
+            return None, f"File {os.path.basename(file_path)} manca colonna 'Rank' o varianti. Colonne trovate: {df.attrs['header']}"
         df = df[df["rank"].apply(lambda x: pd.notna(x) and isinstance(x, (int, float)))]
         if df.empty:
-            st.error(f"File {os.path.basename(file_path)} non contiene righe valide per 'Rank'.")
-            return None
+            return None, f"File {os.path.basename(file_path)} non contiene righe valide per 'Rank'."
         numeric_cols = ["rank", "units"]
         for col in numeric_cols:
             if col in df.columns:
                 df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-        if 'title' in df.columns:
-            df['title'] = df['title'].apply(normalize_title)
-        if 'publisher' in df.columns:
-            df['publisher'] = df['publisher'].apply(normalize_publisher)
-        collana_variants = ["collection", "series", "collana", "collection/series"]
-        collana_col = next((col for col in df.columns if col in collana_variants), None)
-        if collana_col:
-            df = df.rename(columns={collana_col: "collana"})
-        return df
+        # Normalizzati una volta sola, qui: aggregate_all_weeks li riceve già canonici
+        df = canonicalize_frame(df, as_category=False)
+        # Impronta del file sorgente: chiave di cache dei calcoli fatti su questo frame
+        df.attrs["fingerprint"] = file_fingerprint(file_path)
+        return df, None
     except Exception as e:
-        st.error(f"Errore nel caricamento di {os.path.basename(file_path)}: {e}")
-        return None
+        return None, f"Errore nel caricamento di {os.path.basename(file_path)}: {e}"
+
+def chart_file_key(file_path):
+    return file_fingerprint(file_path) if os.path.exists(file_path) else None
+
+# Invalidata quando il file cambia (dimensione o mtime), non solo per percorso
+cached_chart_file = fingerprint_cache("chart_file", chart_file_key)(read_chart_file)
 
+def load_data(file_path):
+    df, error = cached_chart_file(file_path)
+    if error:
+        st.error(error)
+    return df
+
+@timed("filter_data")
 def filter_data(df, filters):
     if df is None:
         return None
@@ -64,6 +63,7 @@ def filter_data(df, filters):
                 filtered_df = filtered_df[filtered_df[col] == value]
     return filtered_df
 
+@timed("aggregate_group_data")
 def aggregate_group_data(df, group_by, values):
     if df is None or not values:
         return None
@@ -75,16 +75,23 @@ def aggregate_group_data(df, group_by, values):
         "Items": len(group_df["title"].unique()) if group_by != "title" else len(values) if isinstance(values, list) else 1
     }
 
-@st.cache_data
+def frames_key(dataframes):
+    # Impronte dei file d'origine al posto dell'hash del contenuto; frame senza impronta → niente cache
+    key = []
+    for name, df in dataframes.items():
+        if df is None:
+            continue
+        if "fingerprint" not in df.attrs:
+            return None
+        key.append((name, df.attrs["fingerprint"], len(df), tuple(df.columns)))
+    return tuple(key)
+
+@timed("aggregate_all_weeks")
+@fingerprint_cache("aggregate_all_weeks", frames_key)
 def aggregate_all_weeks(dataframes):
     all_dfs = [df for df in dataframes.values() if df is not None]
     if not all_dfs:
         return None
-    for df in all_dfs:
-        if 'title' in df.columns:
-            df['title'] = df['title'].apply(normalize_title)
-        if 'publisher' in df.columns:
-            df['publisher'] = df['publisher'].apply(normalize_publisher)
     combined_df = pd.concat(all_dfs, ignore_index=True)
     all_cols = set()
     for df in all_dfs:
@@ -94,7 +101,8 @@ def aggregate_all_weeks(dataframes):
     agg_df['units'] = pd.to_numeric(agg_df['units'], errors='coerce').fillna(0)
     return agg_df
 
-def load_all_dataframes(data_dir):
+@timed("load_all_dataframes")
+def load_all_dataframes(data_dir, workers=None):
     dataframes = {}
     if not os.path.exists(data_dir):
         st.error(f"Cartella {data_dir} non trovata.")
@@ -110,11 +118,20 @@ def load_all_dataframes(data_dir):
     valid_files = sorted(valid_files, key=lambda x: x[1])
     file_paths = [fp for fp, _ in valid_files]
     week_nums = [wn for _, wn in valid_files]
-    
-    with ThreadPoolExecutor() as executor:
-        dfs = list(executor.map(load_data, file_paths))
-    
-    for i in range(len(dfs)):
-        if dfs[i] is not None:
-            dataframes[f"Settimana {week_nums[i]}"] = dfs[i]
+
+    # Solo i file non già in cache passano dal parsing (in parallelo)
+    keys = [("chart_file", chart_file_key(fp)) for fp in file_paths]
+    results = [cache_get(k) for k in keys]
+    missing = [i for i, (hit, _) in enumerate(results) if not hit]
+    parsed = parallel_map(read_chart_file, [file_paths[i] for i in missing], workers)
+    results = [value for _, value in results]
+    for i, value in zip(missing, parsed):
+        results[i] = value
+        cache_put(keys[i], value)
+
+    for week_num, (df, error) in zip(week_nums, results):
+        if error:
+            st.error(error)
+        if df is not None:
+            dataframes[f"Settimana {week_num}"] = df
     return dataframes
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def sort_by_publisher(df):
+    # Ordinato per editore, ogni editore occupa un intervallo contiguo di righe
+    return df.sort_values(["publisher", "year", "week_num"], kind="stable", ignore_index=True)
+
+
+def build_publisher_index(df):
+    codes = df["publisher"].cat.codes.to_numpy()
+    if len(codes) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    stops = np.r_[starts[1:], len(codes)]
+    categories = df["publisher"].cat.categories
+    return {categories[codes[s]]: (int(s), int(e)) for s, e in zip(starts, stops) if codes[s] >= 0}
+
+
+def match_publishers(publishers, pattern):
+    # Stessa semantica di str.contains(case=False), ma sul vocabolario e non sulle righe
+    pattern = pattern.strip().lower()
+    return [p for p in publishers if pattern and pattern in str(p).lower()]
+
+
+def publisher_slice(df, index, publishers):
+    # Un solo editore → vista iloc senza copia; più editori → concatenazione degli intervalli
+    spans = sorted(index[p] for p in publishers if p in index)
+    if not spans:
+        return df.iloc[0:0]
+    if len(spans) == 1:
+        start, stop = spans[0]
+        return df.iloc[start:stop]
+    return pd.concat([df.iloc[start:stop] for start, stop in spans])
+
+
+FILTER_COLUMNS = ["year", "week", "publisher", "author", "title", "collana"]
+
+
+def build_filter_index(df, columns=FILTER_COLUMNS, cache_size=64):
+    # Per ogni colonna: codici per riga + posizioni delle righe raggruppate per valore (CSR)
+    index = {"n_rows": len(df), "columns": {}, "cache": OrderedDict(),
+             "cache_size": cache_size, "lock": threading.Lock()}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype("category")
+        codes = values.cat.codes.to_numpy()
+        n_values = len(values.cat.categories)
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=n_values)
+        offsets = np.r_[0, np.cumsum(counts)] + np.count_nonzero(codes < 0)
+        index["columns"][col] = {
+            "codes": codes,
+            "order": order,
+            "offsets": offsets,
+            "lookup": {v: i for i, v in enumerate(values.cat.categories)},
+        }
+    return index
+
+
+def filter_key(filters):
+    return tuple(sorted(
+        (col, tuple(sorted(str(v) for v in vals)))
+        for col, vals in filters.items() if vals is not None
+    ))
+
+
+def filter_positions(index, filters):
+    # Posizioni (ordinate) delle righe che soddisfano tutti i filtri, con cache LRU
+    key = filter_key(filters)
+    with index["lock"]:
+        if key in index["cache"]:
+            index["cache"].move_to_end(key)
+            return index["cache"][key]
+
+    selected = {}
+    for col, vals in filters.items():
+        if vals is None:
+            continue
+        col_index = index["columns"][col]
+        selected[col] = np.array(sorted({col_index["lookup"][v] for v in vals if v in col_index["lookup"]}), dtype=np.int64)
+
+    if not selected:
+        positions = np.arange(index["n_rows"])
+    else:
+        # Si parte dalla colonna più selettiva, le altre si verificano solo su quelle righe
+        def size(col):
+            offsets = index["columns"][col]["offsets"]
+            return int((offsets[selected[col] + 1] - offsets[selected[col]]).sum())
+        first, *rest = sorted(selected, key=size)
+        col_index = index["columns"][first]
+        offsets, order = col_index["offsets"], col_index["order"]
+        chunks = [order[offsets[c]:offsets[c + 1]] for c in selected[first]]
+        positions = np.sort(np.concatenate(chunks)) if chunks else np.array([], dtype=np.int64)
+        for col in rest:
+            col_index = index["columns"][col]
+            mask = np.zeros(len(col_index["lookup"]) + 1, dtype=bool)
+            mask[selected[col]] = True
+            positions = positions[mask[col_index["codes"][positions]]]
+
+    positions.flags.writeable = False
+    with index["lock"]:
+        index["cache"][key] = positions
+        while len(index["cache"]) > index["cache_size"]:
+            index["cache"].popitem(last=False)
+    return positions
@@ -0,0 +1,121 @@
+# generate_data.py → file "Classifica week N.xlsx" sintetici per i benchmark
+#
+#   python generate_data.py --out bench_data --years 10 --weeks 52 --rows 50000
+#
+# Stessa struttura degli export veri: foglio "Export", una cartella per anno,
+# intestazioni con gli alias di COLUMN_ALIASES, editori e titoli con distribuzione
+# molto sbilanciata (pochi editori/titoli fanno gran parte delle vendite).
+import os
+import argparse
+import numpy as np
+import openpyxl
+from ingest_utils import parallel_map
+
+# Varianti di intestazione viste negli export reali (una per file, a rotazione)
+HEADER_VARIANTS = [
+    ["Rank", "Publisher", "Author", "Title", "Collection/Series", "ISBN / EAN", "Cover price", "Units", "Units since release"],
+    ["Rango", "Editore", "Autore", "Titolo", "Collana", "EAN", "Cover price", "Unità vendute", "Value"],
+    ["Classifica", "Editore", "Autore", "Titolo", "Series", "EAN", "Prezzo", "Copie", "Value (EUR)"],
+]
+WORDS = ["amore", "città", "notte", "mare", "segreto", "libertà", "lupo", "giardino", "viaggio",
+         "memoria", "inverno", "sorella", "isola", "fuoco", "silenzio", "perché", "ombra", "estate"]
+ARTICLES = ["Il", "La", "L'", "Un", "Una", "I", "Le"]
+
+
+def build_catalog(n_titles, n_publishers, n_periods, seed):
+    # Catalogo deterministico (stesso seed → stessi titoli in ogni processo)
+    rng = np.random.default_rng(seed)
+    pub_weights = 1 / np.arange(1, n_publishers + 1) ** 1.1
+    publisher = rng.choice(n_publishers, size=n_titles, p=pub_weights / pub_weights.sum())
+    words = rng.integers(0, len(WORDS), size=(n_titles, 2))
+    articles = rng.integers(0, len(ARTICLES), size=n_titles)
+    titles = [f"{ARTICLES[a]}{'' if ARTICLES[a].endswith(chr(39)) else ' '}{WORDS[w1]} e {WORDS[w2]} {i}"
+              for i, (a, (w1, w2)) in enumerate(zip(articles, words))]
+    # Qualche variante ortografica da canonicalizzare
+    for i in range(0, n_titles, 997):
+        titles[i] = rng.choice(["L'avversario", "L' avversario", "l'avversario "])
+    collana = rng.integers(0, 8, size=n_titles)
+    return {
+        "title": titles,
+        "author": [f"Autore {a:05d}" for a in rng.integers(0, max(1, n_titles // 3), size=n_titles)],
+        "publisher": publisher,
+        "publisher_name": [f"EDITORE {p:04d}" if p % 3 else f"Editore {p:04d}" for p in range(n_publishers)],
+        "collana": [None if c == 0 else f"Collana {c}" for c in collana],
+        "ean": [f"978{e}" for e in rng.integers(10**9, 10**10, size=n_titles)],
+        "price": np.round(rng.uniform(5, 30, size=n_titles), 1),
+        "appeal": rng.lognormal(0, 1.2, size=n_titles),
+        # Settimana di uscita: anche prima dell'inizio, così la prima classifica è già piena
+        "release": rng.integers(-26, n_periods, size=n_titles),
+        "decay": rng.uniform(4, 60, size=n_titles),
+    }
+
+
+def week_sales(catalog, period, rows, seed):
+    # Titoli in classifica nella settimana "period": popolarità che decade dall'uscita
+    rng = np.random.default_rng(seed + period)
+    n_titles = len(catalog["title"])
+    age = period - catalog["release"]
+    weight = np.where(age >= 0, catalog["appeal"] * np.exp(-np.maximum(age, 0) / catalog["decay"]), 0)
+    weight = weight * rng.lognormal(0, 0.3, size=n_titles)
+    rows = min(rows, int(np.count_nonzero(weight)))
+    top = np.argpartition(-weight, rows - 1)[:rows]
+    top = top[np.argsort(-weight[top], kind="stable")]
+    # Curva delle classifiche reali: unità ~ rango^-0.8 (≈6000 copie al primo posto)
+    units = 6000 * np.arange(1, rows + 1) ** -0.8 * rng.lognormal(0, 0.1, size=rows)
+    units = np.sort(np.maximum(1, np.round(units)).astype(int))[::-1]
+    return top, units
+
+
+_catalogs = {}
+
+
+def write_week_file(task):
+    path, catalog_args, period, rows = task
+    if catalog_args not in _catalogs:
+        _catalogs.clear()
+        _catalogs[catalog_args] = build_catalog(*catalog_args)
+    catalog = _catalogs[catalog_args]
+    top, units = week_sales(catalog, period, rows, catalog_args[-1])
+    variant = period % len(HEADER_VARIANTS)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Export")
+    ws.append(HEADER_VARIANTS[variant])
+    for rank, (i, u) in enumerate(zip(top, units), start=1):
+        price = float(catalog["price"][i])
+        # La terza variante scrive le unità come testo in formato italiano ("1.234")
+        units_cell = f"{u:,}".replace(",", ".") if variant == 2 else float(u)
+        last = float(u * 7) if variant == 0 else round(u * price, 2)
+        ws.append([float(rank), catalog["publisher_name"][catalog["publisher"][i]], catalog["author"][i],
+                   catalog["title"][i], catalog["collana"][i], catalog["ean"][i], price, units_cell, last])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wb.save(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def generate(out, years=2, start_year=2020, weeks=52, rows=5000, titles=None, publishers=800, seed=42, workers=None):
+    titles = titles or rows * 4
+    n_periods = years * weeks
+    tasks = []
+    for y in range(years):
+        for w in range(1, weeks + 1):
+            path = os.path.join(out, str(start_year + y), f"Classifica week {w}.xlsx")
+            tasks.append((path, (titles, publishers, n_periods, seed), y * weeks + w - 1, rows))
+    return parallel_map(write_week_file, tasks, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera classifiche settimanali sintetiche")
+    parser.add_argument("--out", default="bench_data")
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--start-year", type=int, default=2020)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--rows", type=int, default=5000, help="righe per file")
+    parser.add_argument("--titles", type=int, default=None, help="titoli in catalogo (default 4 × righe)")
+    parser.add_argument("--publishers", type=int, default=800)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    files = generate(args.out, args.years, args.start_year, args.weeks, args.rows,
+                     args.titles, args.publishers, args.seed, args.workers)
+    print(f"{len(files)} file scritti in {args.out}")
@@ -0,0 +1,48 @@
+import os
+import pandas as pd
+
+# Tetto di celle inviate al browser per ogni heatmap (titoli × settimane)
+HEATMAP_MAX_CELLS = int(os.environ.get("HEATMAP_MAX_CELLS", "15000"))
+HEATMAP_PAGE_SIZE = int(os.environ.get("HEATMAP_PAGE_SIZE", "60"))
+
+
+def heatmap_cells(table, idx, value):
+    # Una riga per cella presente (niente pivot/melt/merge): solo le colonne disegnate
+    cells = table[[idx, "week", "units", value]].copy()
+    cells[idx] = cells[idx].astype(str)
+    cells["week"] = cells["week"].astype(str)
+    cells["units"] = cells["units"].astype("int64")
+    if pd.api.types.is_float_dtype(cells[value]):
+        cells[value] = cells[value].fillna(0).round(1)
+    return cells
+
+
+def rank_rows(cells, idx):
+    # Ordine delle righe calcolato qui (vendite totali decrescenti), non da Vega nel browser
+    totals = cells.groupby(idx, sort=False)["units"].sum()
+    return list(totals.sort_values(ascending=False, kind="stable").index)
+
+
+def rows_per_page(cells, page_size=HEATMAP_PAGE_SIZE, max_cells=HEATMAP_MAX_CELLS):
+    # Righe per pagina entro il budget di celle: min(page_size, budget / settimane)
+    n_weeks = max(1, cells["week"].nunique())
+    return max(1, min(page_size, max_cells // n_weeks))
+
+
+def page_count(cells, order, page_size=HEATMAP_PAGE_SIZE, max_cells=HEATMAP_MAX_CELLS):
+    return max(1, -(-len(order) // rows_per_page(cells, page_size, max_cells)))
+
+
+def heatmap_page(cells, idx, order, page=1, page_size=HEATMAP_PAGE_SIZE, max_cells=HEATMAP_MAX_CELLS):
+    per_page = rows_per_page(cells, page_size, max_cells)
+    n_pages = page_count(cells, order, page_size, max_cells)
+    page = min(max(1, int(page)), n_pages)
+    rows = order[(page - 1) * per_page:page * per_page]
+    return {
+        "cells": cells[cells[idx].isin(rows)],
+        "rows": rows,
+        "page": page,
+        "n_pages": n_pages,
+        "per_page": per_page,
+        "n_rows": len(order),
+    }
@@ -0,0 +1,181 @@
+import os
+import glob
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import openpyxl
+import pandas as pd
+from canon_utils import canonicalize_frame
+
+DATA_DIR = "data"
+WEEK_FILE_PATTERN = "Classifica week*.xlsx"
+# Numero di processi per il parsing degli xlsx (0 = tutti i core)
+BUILD_WORKERS = int(os.environ.get("BUILD_WORKERS", "0"))
+
+# Nomi colonna normalizzati (minuscolo, "_" al posto degli spazi) → campo canonico
+COLUMN_ALIASES = {
+    "rank": ["rank", "rango", "classifica"],
+    "title": ["title", "titolo"],
+    "author": ["author", "autore"],
+    "publisher": ["publisher", "editore"],
+    "units": ["units", "unità_vendute", "vendite", "unità", "copie", "qty"],
+    "collana": ["collana", "collection", "series", "collection/series"],
+}
+BUILD_FIELDS = ["rank", "title", "author", "publisher", "units", "value", "cover_price", "collana"]
+# Dopo i dati gli export hanno ~1M di righe vuote: ci si ferma alla prima serie di righe vuote
+MAX_BLANK_ROWS = 50
+
+
+def week_label(week_num):
+    return f"Settimana {str(week_num).zfill(2)}"
+
+
+def week_number(week):
+    # Accetta sia il numero sia l'etichetta "Settimana 05"
+    if isinstance(week, str):
+        return int(week.split()[-1])
+    return int(week)
+
+
+def discover_week_files(data_dir=DATA_DIR):
+    # Ogni sottocartella "data/AAAA" è un anno: non serve più aggiungerli a mano
+    files = []
+    for year_dir in glob.glob(os.path.join(data_dir, "[0-9][0-9][0-9][0-9]")):
+        year = int(os.path.basename(year_dir))
+        for f in glob.glob(os.path.join(year_dir, WEEK_FILE_PATTERN)):
+            m = re.search(r'(?:week|Settimana)\s*(\d+)', os.path.basename(f), re.I)
+            if m and 1 <= int(m.group(1)) <= 53:
+                files.append((year, int(m.group(1)), f))
+    return sorted(files)
+
+
+def normalize_header(header):
+    return [str(c).strip().lower().replace(" ", "_") if c is not None else "" for c in header]
+
+
+def sniff_header(header):
+    cols = normalize_header(header)
+    positions = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        pos = next((cols.index(a) for a in aliases if a in cols), None)
+        if pos is not None:
+            positions[field] = pos
+    # Fatturato: prima "value", altrimenti unità × prezzo di copertina
+    value_pos = next((i for i, c in enumerate(cols) if c == "value"), None)
+    if value_pos is None:
+        value_pos = next((i for i, c in enumerate(cols) if "value" in c), None)
+    if value_pos is not None:
+        positions["value"] = value_pos
+    else:
+        price_pos = next((i for i, c in enumerate(cols) if "cover" in c and "price" in c), None)
+        if price_pos is not None:
+            positions["cover_price"] = price_pos
+    return positions
+
+
+def read_export_sheet(path, fields=None, sheet_name="Export"):
+    # Lettura in streaming (read_only): si materializzano solo le colonne richieste
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = sniff_header(header)
+        if fields is not None:
+            positions = {f: i for f, i in positions.items() if f in fields}
+        columns = {f: [] for f in positions}
+        items = list(positions.items())
+        blank = 0
+        for row in rows:
+            values = [row[i] if i < len(row) else None for _, i in items]
+            if all(v is None or v == "" for v in values):
+                blank += 1
+                if blank >= MAX_BLANK_ROWS:
+                    break
+                continue
+            blank = 0
+            for (f, _), v in zip(items, values):
+                columns[f].append(None if v == "" else v)
+    finally:
+        wb.close()
+    df = pd.DataFrame(columns)
+    df.attrs["header"] = normalize_header(header)
+    return df
+
+
+def to_number(series):
+    # I numeri veri passano così come sono; le stringhe sono in formato italiano ("1.234,5")
+    is_text = series.map(lambda v: isinstance(v, str))
+    num = pd.to_numeric(series.where(~is_text), errors="coerce")
+    if is_text.any():
+        text = series[is_text].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        num[is_text] = pd.to_numeric(text, errors="coerce")
+    return num
+
+
+def parse_week_file(f, year, week_num):
+    df = read_export_sheet(f, BUILD_FIELDS)
+    if "units" not in df.columns:
+        return None
+    df["units"] = to_number(df["units"]).fillna(0)
+
+    if "value" in df.columns:
+        df["fatturato"] = to_number(df["value"]).fillna(0)
+    elif "cover_price" in df.columns:
+        df["fatturato"] = df["units"] * to_number(df["cover_price"]).fillna(0)
+    else:
+        df["fatturato"] = 0.0
+
+    # Posizione in classifica; se manca (colonna, cella vuota o "-") resta mancante: nessuna
+    # posizione inventata, nel master vale 0
+    df["rank"] = to_number(df["rank"]) if "rank" in df.columns else float("nan")
+
+    df["week"] = week_label(week_num)
+    df["year"] = int(year)
+
+    keep = ["title","author","publisher","units","fatturato","rank","week","year"]
+    if "collana" in df.columns: keep.append("collana")
+    return df.reindex(columns=keep)
+
+
+def finalize_master(master):
+    master["units"] = pd.to_numeric(master["units"], errors="coerce").fillna(0).astype("int32")
+    master["fatturato"] = pd.to_numeric(master["fatturato"], errors="coerce").fillna(0)
+    # 0 = posizione mancante
+    master["rank"] = pd.to_numeric(master["rank"], errors="coerce").fillna(0).astype("int32")
+    # Titoli, autori, editori e collane: regole e alias sui soli valori distinti
+    return canonicalize_frame(master)
+
+
+def parse_week_task(task):
+    year, week_num, path = task
+    try:
+        df = parse_week_file(path, year, week_num)
+    except Exception as e:
+        return None, f"Errore lettura {os.path.basename(path)}: {e}"
+    if df is None:
+        return None, f"Nessuna colonna unità in {os.path.basename(path)} – salto il file"
+    return finalize_master(df), None
+
+
+def resolve_workers(workers, n_tasks):
+    if not workers:
+        workers = BUILD_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, n_tasks))
+
+
+def parallel_map(func, items, workers=None):
+    # openpyxl è legato al GIL: servono processi, non thread.
+    # "spawn" evita il fork del processo multi-thread di Streamlit.
+    items = list(items)
+    workers = resolve_workers(workers, len(items))
+    if workers == 1:
+        return [func(item) for item in items]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+        return list(executor.map(func, items))
+
+
+def parse_week_files(tasks, workers=None):
+    # I risultati tornano sempre in ordine (anno, settimana), qualunque sia il numero di processi
+    tasks = sorted(tasks)
+    return list(zip(tasks, parallel_map(parse_week_task, tasks, workers)))
@@ -0,0 +1,256 @@
+import os
+import json
+import glob
+import re
+import shutil
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from canon_utils import alias_signature
+from ingest_utils import DATA_DIR, discover_week_files, parse_week_files, week_label, week_number
+
+# Dataset partizionato Hive: data/master_sales/year=AAAA/week=N/part-<file>.parquet, un file
+# per classifica sorgente (due file della stessa settimana non si sovrascrivono)
+MASTER_PATH = os.path.join(DATA_DIR, "master_sales")
+MANIFEST_PATH = os.path.join(DATA_DIR, "master_manifest.json")
+# Copia del master per l'app: Arrow IPC non compresso, già ordinato per editore, aperto con
+# mmap. Le colonne numeriche restano nel file (zero copie) e le pagine stanno nel page cache,
+# condivise da tutte le sessioni e da tutti i processi
+ARROW_PATH = os.path.join(DATA_DIR, "master_sales.arrow")
+# Scritto per ultimo da create_parquet.py: finché non cambia l'app usa la build precedente
+VERSION_PATH = os.path.join(DATA_DIR, "master_version.json")
+MASTER_COLUMNS = ["title", "author", "publisher", "units", "fatturato", "rank", "week", "week_num", "year", "collana"]
+TEXT_COLUMNS = ["title", "author", "publisher", "collana"]
+# Schema canonico: testi come dizionari (categorie in pandas), interi piccoli
+TEXT_TYPE = pa.dictionary(pa.int32(), pa.string())
+PARTITION_SCHEMA = pa.schema([(c, TEXT_TYPE) for c in TEXT_COLUMNS] + [
+    ("units", pa.int32()),
+    ("fatturato", pa.float64()),
+    ("rank", pa.int32()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16()), ("week", pa.int8())]), flavor="hive")
+# Cambiando lo schema si incrementa la versione: il master viene ricostruito da zero
+SCHEMA_VERSION = 5
+WEEK_DTYPE = pd.CategoricalDtype([week_label(w) for w in range(1, 54)], ordered=True)
+# Righe ordinate per editore: le statistiche dei row group permettono di saltare interi blocchi
+ROW_GROUP_SIZE = 2048
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_signature(path, previous=None):
+    # L'hash si ricalcola solo se dimensione o mtime sono cambiati
+    stat = os.stat(path)
+    sig = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if previous and previous.get("size") == sig["size"] and previous.get("mtime") == sig["mtime"]:
+        sig["sha256"] = previous["sha256"]
+    else:
+        sig["sha256"] = file_sha256(path)
+    return sig
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    with open(manifest_path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def manifest_token(manifest_path=MANIFEST_PATH, build_id=""):
+    # Hash del manifest + id della build: cambia a ogni build pubblicata, anche a parità di
+    # file (--full, correzioni del codice di lettura)
+    with open(manifest_path, "rb") as fh:
+        return hashlib.sha1(fh.read() + build_id.encode()).hexdigest()[:12]
+
+
+def version_info(version_path=VERSION_PATH):
+    if not os.path.exists(version_path):
+        return None
+    with open(version_path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def master_version(version_path=VERSION_PATH):
+    # Token di versione della build pubblicata (None se il master non è mai stato costruito)
+    info = version_info(version_path)
+    return info["version"] if info else None
+
+
+def publish_version(info, version_path=VERSION_PATH):
+    tmp = version_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(info, fh, indent=1, sort_keys=True)
+    os.replace(tmp, version_path)
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+
+
+def plan_update(data_dir=DATA_DIR, master_path=MASTER_PATH, manifest_path=MANIFEST_PATH):
+    # Senza master (o con uno schema vecchio) il manifest non vale nulla: ricostruzione completa
+    manifest = load_manifest(manifest_path)
+    # Lo stesso vale se è cambiata la tabella degli alias
+    valid = (os.path.isdir(master_path) and manifest.get("schema") == SCHEMA_VERSION
+             and manifest.get("aliases") == alias_signature())
+    old = manifest["files"] if valid else {}
+    files = {}
+    changed = []
+    for year, week_num, path in discover_week_files(data_dir):
+        key = os.path.relpath(path, data_dir).replace(os.sep, "/")
+        prev = old.get(key)
+        entry = {**file_signature(path, prev), "year": year, "week": week_num}
+        files[key] = entry
+        if prev is None or prev["sha256"] != entry["sha256"]:
+            changed.append(key)
+    deleted = [key for key in old if key not in files]
+    return {"files": files, "old": old, "changed": changed, "deleted": deleted}
+
+
+def needs_update(plan):
+    return bool(plan["changed"] or plan["deleted"])
+
+
+def partition_dir(master_path, year, week_num):
+    return os.path.join(master_path, f"year={int(year)}", f"week={int(week_num)}")
+
+
+def list_partitions(master_path=MASTER_PATH):
+    parts = []
+    for d in glob.glob(os.path.join(master_path, "year=*", "week=*")):
+        m = re.search(r"year=(\d+)[\\/]week=(\d+)$", d)
+        if m and glob.glob(os.path.join(d, "part-*.parquet")):
+            parts.append((int(m.group(1)), int(m.group(2))))
+    return sorted(parts)
+
+
+def part_name(source):
+    # Nome stabile del file della partizione per la classifica sorgente (chiave del manifest)
+    return f"part-{hashlib.sha1(source.encode()).hexdigest()[:12]}.parquet"
+
+
+def write_partition(df, year, week_num, source, master_path=MASTER_PATH):
+    part = df.reindex(columns=PARTITION_SCHEMA.names)
+    part[TEXT_COLUMNS] = part[TEXT_COLUMNS].astype(object)
+    part = part.sort_values(["publisher", "units"], ascending=[True, False], kind="stable")
+    table = pa.Table.from_pandas(part, schema=PARTITION_SCHEMA, preserve_index=False)
+    out_dir = partition_dir(master_path, year, week_num)
+    os.makedirs(out_dir, exist_ok=True)
+    target = os.path.join(out_dir, part_name(source))
+    pq.write_table(table, target + ".tmp", compression="zstd",
+                   row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+    os.replace(target + ".tmp", target)
+
+
+def remove_partition(year, week_num, source, master_path=MASTER_PATH):
+    # Solo la parte del file sorgente: le altre classifiche della stessa settimana restano
+    out_dir = partition_dir(master_path, year, week_num)
+    try:
+        os.remove(os.path.join(out_dir, part_name(source)))
+    except FileNotFoundError:
+        pass
+    if os.path.isdir(out_dir) and not os.listdir(out_dir):
+        os.rmdir(out_dir)
+
+
+def build_master(plan=None, data_dir=DATA_DIR, master_path=MASTER_PATH, manifest_path=MANIFEST_PATH, workers=None):
+    if plan is None:
+        plan = plan_update(data_dir, master_path, manifest_path)
+    warnings = []
+
+    if not plan["old"] and os.path.isdir(master_path):
+        shutil.rmtree(master_path)
+    # Parti da eliminare: file modificati o cancellati (le altre della settimana restano)
+    for key in plan["deleted"] + [k for k in plan["changed"] if k in plan["old"]]:
+        remove_partition(plan["old"][key]["year"], plan["old"][key]["week"], key, master_path)
+
+    manifest_files = {k: e for k, e in plan["files"].items() if k not in plan["changed"]}
+    tasks = [(plan["files"][k]["year"], plan["files"][k]["week"], os.path.join(data_dir, k)) for k in plan["changed"]]
+    for (year, week_num, path), (df, error) in parse_week_files(tasks, workers):
+        if error:
+            warnings.append(error)
+            continue
+        key = os.path.relpath(path, data_dir).replace(os.sep, "/")
+        write_partition(df, year, week_num, key, master_path)
+        manifest_files[key] = plan["files"][key]
+
+    if not list_partitions(master_path):
+        warnings.append("Nessun dato trovato in " + data_dir)
+        return None, warnings
+
+    save_manifest({"schema": SCHEMA_VERSION, "aliases": alias_signature(), "files": manifest_files}, manifest_path)
+    return open_master(master_path).count_rows(), warnings
+
+
+def open_master(master_path=MASTER_PATH):
+    return ds.dataset(master_path, format="parquet", partitioning=PARTITIONING)
+
+
+def read_master(years=None, weeks=None, publishers=None, columns=None, master_path=MASTER_PATH):
+    # I predicati su anno/settimana selezionano le partizioni, quello sull'editore
+    # sfrutta le statistiche dei row group: si legge solo ciò che serve
+    expr = None
+    predicates = []
+    if years is not None:
+        predicates.append(ds.field("year").isin([int(y) for y in years]))
+    if weeks is not None:
+        predicates.append(ds.field("week").isin([week_number(w) for w in weeks]))
+    if publishers is not None:
+        predicates.append(ds.field("publisher").isin(list(publishers)))
+    for p in predicates:
+        expr = p if expr is None else expr & p
+
+    wanted = [c for c in MASTER_COLUMNS if columns is None or c in columns]
+    # "week" e "week_num" derivano entrambe dalla partizione week=N
+    read_cols = [c for c in wanted if c != "week_num"]
+    if "week_num" in wanted and "week" not in read_cols:
+        read_cols.append("week")
+    df = open_master(master_path).to_table(columns=read_cols, filter=expr).to_pandas()
+    return apply_schema(df)[wanted]
+
+
+def apply_schema(df):
+    for col in TEXT_COLUMNS:
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+        else:
+            df[col] = df[col].astype("category")
+    if "week" in df.columns and not isinstance(df["week"].dtype, pd.CategoricalDtype):
+        df["week_num"] = df["week"].astype("int8")
+        df["week"] = pd.Categorical.from_codes(df["week_num"] - 1, dtype=WEEK_DTYPE).remove_unused_categories()
+    if "year" in df.columns:
+        df["year"] = df["year"].astype("int16")
+    if "units" in df.columns:
+        df["units"] = df["units"].astype("int32")
+    if "rank" in df.columns:
+        df["rank"] = df["rank"].astype("int32")
+    return df
+
+
+def write_master_arrow(df, arrow_path=ARROW_PATH):
+    # Un solo chunk per colonna: in lettura il buffer numerico diventa direttamente l'array pandas
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    with pa.OSFile(arrow_path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    # Chi ha già mappato il file precedente continua a leggere il vecchio inode
+    os.replace(arrow_path + ".tmp", arrow_path)
+    return os.path.getsize(arrow_path)
+
+
+def read_master_arrow(arrow_path=ARROW_PATH):
+    # Colonne numeriche in sola lettura, appoggiate alla mappa del file
+    table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+    return table.to_pandas(split_blocks=True)
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Matrice sparsa delle vendite: riga (editore, titolo, collana) × anno × settimana 1–53, in
+# formato CSR (offset per riga + celle non vuote "anno * 53 + settimana"). La memoria cresce
+# con le settimane in classifica, non con righe × anni. Gli anni sono contigui (anno - primo
+# anno), quindi "anno precedente" è sempre l'indice - 1
+MATRIX_KEY = ["publisher", "title", "collana"]
+N_WEEKS = 53
+
+
+def build_title_matrix(df):
+    grouped = df.groupby(MATRIX_KEY, observed=True, dropna=False, sort=True)
+    ids = grouped.ngroup().to_numpy(np.int64)
+    keys = grouped.size().index.to_frame(index=False).astype(object)
+    years = df["year"].to_numpy(np.int64)
+    first_year = int(years.min()) if len(years) else 0
+    n_years = int(years.max()) - first_year + 1 if len(years) else 0
+    year_idx = years - first_year
+    week_idx = df["week_num"].to_numpy(np.int64) - 1
+
+    # Celle distinte in ordine (riga, anno, settimana); più righe del master nella stessa cella si sommano
+    span = n_years * N_WEEKS
+    flat, inverse = np.unique(ids * span + year_idx * N_WEEKS + week_idx, return_inverse=True)
+    units = np.zeros(len(flat), dtype=np.int64)
+    np.add.at(units, inverse, df["units"].to_numpy(np.int64))
+    present = np.zeros((n_years, N_WEEKS), dtype=bool)
+    present[year_idx, week_idx] = True
+    return {
+        "keys": keys,
+        "first_year": first_year,
+        "years": np.arange(first_year, first_year + n_years),
+        "offsets": np.searchsorted(flat // max(span, 1), np.arange(len(keys) + 1)),
+        "cells": (flat % max(span, 1)).astype(np.int32),
+        "units": units.astype(np.int32),
+        "present": present,
+    }
+
+
+def matrix_rows(matrix, publishers=None, filters=None):
+    keys = matrix["keys"]
+    mask = np.ones(len(keys), dtype=bool)
+    if publishers is not None:
+        mask &= keys["publisher"].isin(list(publishers)).to_numpy()
+    for col, vals in (filters or {}).items():
+        if vals:
+            mask &= keys[col].isin(list(vals)).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def title_cube(matrix, rows):
+    # Cubo denso titolo × anno × settimana delle sole righe scelte, sommate per titolo
+    # (lo stesso titolo può stare in più collane)
+    titles, inverse = np.unique(matrix["keys"]["title"].to_numpy()[rows].astype(str), return_inverse=True)
+    n_years = len(matrix["years"])
+    starts, stops = matrix["offsets"][rows], matrix["offsets"][np.asarray(rows) + 1]
+    counts = stops - starts
+    # Posizioni delle celle di ogni riga scelta, concatenate
+    idx = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    cube = np.zeros(len(titles) * n_years * N_WEEKS, dtype=np.int64)
+    np.add.at(cube, np.repeat(inverse, counts) * (n_years * N_WEEKS) + matrix["cells"][idx], matrix["units"][idx])
+    return titles, cube.reshape(len(titles), n_years, N_WEEKS)
+
+
+def year_index(matrix, year):
+    return int(year) - matrix["first_year"]
+
+
+def year_slice(cube, matrix, year):
+    # Vendite settimanali di un anno; anni fuori dalla matrice valgono 0
+    i = year_index(matrix, year)
+    if 0 <= i < cube.shape[1]:
+        return cube[:, i, :]
+    return np.zeros((cube.shape[0], N_WEEKS), dtype=cube.dtype)
+
+
+def yearly_totals(cube):
+    return cube.sum(axis=2)
+
+
+def yoy_diff(cube, matrix, year, prev_year=None):
+    prev_year = int(year) - 1 if prev_year is None else prev_year
+    return year_slice(cube, matrix, year).sum(axis=1) - year_slice(cube, matrix, prev_year).sum(axis=1)
+
+
+def yoy_pct(cube, matrix, year, prev_year=None):
+    prev_year = int(year) - 1 if prev_year is None else prev_year
+    prev = year_slice(cube, matrix, prev_year).sum(axis=1)
+    diff = yoy_diff(cube, matrix, year, prev_year)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(prev > 0, diff / prev * 100, np.nan)
+
+
+def ytd(cube, matrix, year, week_num):
+    # Progressivo dell'anno fino alla settimana indicata (inclusa)
+    return year_slice(cube, matrix, year)[:, :int(week_num)].sum(axis=1)
+
+
+def ytd_curve(cube, matrix, year):
+    return np.cumsum(year_slice(cube, matrix, year), axis=1)
+
+
+def same_week_last_year(cube, matrix, year, week_num):
+    return year_slice(cube, matrix, int(year) - 1)[:, int(week_num) - 1]
+
+
+def latest_week(matrix, year):
+    weeks = np.flatnonzero(matrix["present"][year_index(matrix, year)])
+    return int(weeks[-1]) + 1 if len(weeks) else 0
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import uuid
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+import altair as alt
+
+# Strumentazione opzionale: spenta non costa nulla (nessun timer, nessuna serializzazione).
+# Si accende con PERF_TRACE=1 oppure aprendo l'app con ?debug=1
+PERF_ENABLED = os.environ.get("PERF_TRACE", "") == "1"
+# tracemalloc vale per tutto il processo (e lo rallenta): solo da variabile d'ambiente, mai
+# da una sessione. Con più sessioni attive i picchi per stage sono indicativi
+PERF_MEMORY = PERF_ENABLED and os.environ.get("PERF_TRACE_MEMORY", "") == "1"
+# Log JSONL dei rerun solo se richiesto (PERF_LOG_PATH=perf_log.jsonl), ruotato oltre la soglia
+PERF_LOG_PATH = os.environ.get("PERF_LOG_PATH", "")
+PERF_LOG_MAX_MB = float(os.environ.get("PERF_LOG_MAX_MB", "10"))
+
+# Ogni sessione Streamlit esegue lo script nel proprio thread
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+def start_run(enabled, session=None):
+    if not enabled:
+        _local.run = None
+        return None
+    # Acceso una volta per processo e mai spento da una sessione
+    memory = PERF_MEMORY
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _local.run = {
+        "run_id": uuid.uuid4().hex[:8],
+        "session": session,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "memory": memory,
+        "start": time.perf_counter(),
+        "stages": [],
+        "counters": {},
+        "stack": [],
+    }
+    return _local.run
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    # with stage("filtri", rows_in=n) as s: ...; s["rows_out"] = len(out)
+    run = current_run()
+    if run is None:
+        yield {}
+        return
+    rec = {"stage": name, "depth": len(run["stack"]), "start_s": round(time.perf_counter() - run["start"], 4),
+           "rows_in": rows_in, "rows_out": None, "payload_bytes": None}
+    tracing = run["memory"] and tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # Il picco del livello superiore va salvato prima di azzerarlo per questo livello
+        if run["stack"]:
+            parent = run["stack"][-1]
+            parent["_peak"] = max(parent["_peak"], peak)
+        tracemalloc.reset_peak()
+        rec["_base"], rec["_peak"] = current, current
+    run["stack"].append(rec)
+    start = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec["seconds"] = round(time.perf_counter() - start, 4)
+        run["stack"].pop()
+        if tracing:
+            peak = max(rec.pop("_peak"), tracemalloc.get_traced_memory()[1])
+            rec["peak_mb"] = round((peak - rec.pop("_base")) / 2**20, 2)
+            if run["stack"]:
+                run["stack"][-1]["_peak"] = max(run["stack"][-1]["_peak"], peak)
+        run["stages"].append(rec)
+
+
+def count(name, n=1):
+    run = current_run()
+    if run is not None:
+        run["counters"][name] = run["counters"].get(name, 0) + n
+
+
+def payload_bytes(chart):
+    # Senza il limite di righe di Altair e senza validazione (come batch_report): la misura
+    # non deve mai cambiare cosa fa l'app, al massimo resta None
+    try:
+        with alt.data_transformers.disable_max_rows():
+            return len(chart.to_json(indent=None, validate=False))
+    except Exception:
+        return None
+
+
+def record_payload(rec, chart):
+    # Byte della specifica Vega-Lite inviata al browser (serializza: solo se attivo)
+    if current_run() is not None and rec is not None:
+        rec["payload_bytes"] = payload_bytes(chart)
+        if rec["payload_bytes"] is not None:
+            count("chart_payload_bytes", rec["payload_bytes"])
+
+
+def timed(name):
+    # Decoratore per le funzioni di data_utils / viz_utils: righe in ingresso/uscita se sono
+    # DataFrame, byte della specifica se il risultato è un grafico
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if current_run() is None:
+                return func(*args, **kwargs)
+            first = args[0] if args else None
+            rows_in = len(first) if isinstance(first, pd.DataFrame) else None
+            with stage(name, rows_in) as rec:
+                result = func(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    rec["rows_out"] = len(result)
+                elif hasattr(result, "to_json"):
+                    record_payload(rec, result)
+            return result
+        # Le funzioni st.cache_data mantengono .clear()
+        if hasattr(func, "clear"):
+            inner.clear = func.clear
+        return inner
+    return wrap
+
+
+def append_log(run, log_path, max_mb=PERF_LOG_MAX_MB):
+    with _log_lock:
+        # Oltre la soglia il file corrente diventa .1 (il precedente .1 si perde)
+        if os.path.exists(log_path) and os.path.getsize(log_path) > max_mb * 2**20:
+            os.replace(log_path, log_path + ".1")
+        with open(log_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(run, ensure_ascii=False, default=str) + "\n")
+
+
+def finish_run(log_path=PERF_LOG_PATH):
+    run = current_run()
+    _local.run = None
+    if run is None:
+        return None
+    run.pop("stack")
+    run["total_seconds"] = round(time.perf_counter() - run.pop("start"), 4)
+    # Gli stage annidati si chiudono prima del padre: si riordinano per inizio
+    run["stages"].sort(key=lambda r: r["start_s"])
+    if log_path:
+        append_log(run, log_path)
+    return run
+
+
+def runs_to_jsonl(runs):
+    return "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in runs)
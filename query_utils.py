@@ -0,0 +1,106 @@
+import os
+import threading
+import pandas as pd
+from ingest_utils import week_number
+from master_utils import MASTER_PATH, TEXT_COLUMNS, read_master, apply_schema
+
+try:
+    import duckdb
+except ImportError:  # dipendenza opzionale
+    duckdb = None
+
+# Motore delle aggregazioni: "pandas" (default) oppure "duckdb" (se installato)
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas").lower()
+MEASURES = ["units", "fatturato"]
+
+_local = threading.local()
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def backend_name(requested=QUERY_BACKEND):
+    return "duckdb" if requested == "duckdb" and duckdb is not None else "pandas"
+
+
+def duckdb_cursor():
+    # Una connessione in memoria per processo, un cursore per thread (sessione Streamlit)
+    global _connection
+    if getattr(_local, "cursor", None) is None:
+        with _connection_lock:
+            if _connection is None:
+                _connection = duckdb.connect()
+            _local.cursor = _connection.cursor()
+    return _local.cursor
+
+
+def filter_values(col, vals):
+    if col == "week":
+        return [week_number(v) for v in vals]
+    if col == "year":
+        return [int(v) for v in vals]
+    return [str(v) for v in vals]
+
+
+def finish(df, group_by, measures, order_by, limit):
+    # Stesso formato qualunque sia il motore: schema del master (categorie in ordine
+    # alfabetico), interi, ordinamento stabile
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+    df = apply_schema(df)
+    for m in measures:
+        df[m] = df[m].astype("int64") if m == "units" else df[m].astype("float64")
+    keys = ["week_num" if c == "week" else c for c in group_by]
+    if order_by:
+        df = df.sort_values([order_by] + keys, ascending=[False] + [True] * len(keys), kind="stable")
+    else:
+        df = df.sort_values(keys, kind="stable")
+    if limit:
+        df = df.head(limit)
+    return df[list(group_by) + list(measures)].reset_index(drop=True)
+
+
+def aggregate_pandas(group_by, filters, measures, master=None, master_path=MASTER_PATH):
+    if master is None:
+        # Anno, settimana ed editore scendono nella lettura del parquet
+        master = read_master(filters.get("year"), filters.get("week"), filters.get("publisher"),
+                             columns=set(group_by) | set(filters) | set(measures) | {"week_num"},
+                             master_path=master_path)
+    mask = pd.Series(True, index=master.index)
+    for col, vals in filters.items():
+        if col == "week":
+            mask &= master["week_num"].isin(filter_values(col, vals))
+        else:
+            mask &= master[col].isin(filter_values(col, vals))
+    grouped = master[mask].groupby(list(group_by), observed=True)[list(measures)].sum().reset_index()
+    if "week" in grouped.columns:
+        grouped["week"] = [week_number(w) for w in grouped["week"]]
+    return grouped
+
+
+def aggregate_duckdb(group_by, filters, measures, master_path=MASTER_PATH):
+    # Proiezione e filtri scendono nella scansione del parquet partizionato
+    source = f"read_parquet('{os.path.join(master_path, '**', '*.parquet')}', hive_partitioning = true)"
+    # Come il groupby di pandas: i gruppi con chiave mancante non compaiono
+    where = [f'"{c}" IS NOT NULL' for c in group_by]
+    params = []
+    for col, vals in filters.items():
+        vals = filter_values(col, vals)
+        where.append(f'"{col}" IN ({", ".join("?" for _ in vals)})' if vals else "FALSE")
+        params.extend(vals)
+    cols = ", ".join(f'"{c}"' for c in group_by)
+    sums = ", ".join(f'SUM("{m}") AS "{m}"' for m in measures)
+    sql = f"SELECT {cols}, {sums} FROM {source} WHERE {' AND '.join(where)} GROUP BY {cols}"
+    return duckdb_cursor().execute(sql, params).df()
+
+
+def aggregate(group_by, filters=None, measures=("units",), order_by=None, limit=None,
+              backend=None, master=None, master_path=MASTER_PATH):
+    # Somma delle misure per gruppo con i filtri {colonna: valori}; restituisce solo il risultato
+    filters = {c: v for c, v in (filters or {}).items() if v is not None}
+    if backend_name(backend or QUERY_BACKEND) == "duckdb":
+        df = aggregate_duckdb(group_by, filters, measures, master_path)
+    else:
+        df = aggregate_pandas(group_by, filters, measures, master, master_path)
+    return finish(df, group_by, measures, order_by, limit)
+
@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from ingest_utils import DATA_DIR, week_number
+from master_utils import MASTER_PATH, open_master, apply_schema
+
+ROLLUP_DIR = os.path.join(DATA_DIR, "master_rollups")
+# Aggregati precalcolati accanto al master: nome → dimensioni
+ROLLUPS = {
+    "year_week_publisher": ["year", "week", "publisher"],
+    "year_week_author": ["year", "week", "author"],
+    "year_week_title_collana": ["year", "week", "title", "collana"],
+    "year_publisher_title": ["year", "publisher", "title"],
+}
+MEASURES = ["units", "fatturato"]
+
+
+def rollup_path(name, rollup_dir=ROLLUP_DIR):
+    return os.path.join(rollup_dir, f"{name}.parquet")
+
+
+def rollups_ready(rollup_dir=ROLLUP_DIR):
+    return all(os.path.exists(rollup_path(n, rollup_dir)) for n in ROLLUPS)
+
+
+def build_rollups(master_path=MASTER_PATH, rollup_dir=ROLLUP_DIR):
+    # "week" resta il numero intero della partizione: l'etichetta si ricava in lettura
+    cols = sorted({c for dims in ROLLUPS.values() for c in dims} - {"year", "week"}) + MEASURES
+    df = open_master(master_path).to_table(columns=cols + ["year", "week"]).to_pandas()
+    os.makedirs(rollup_dir, exist_ok=True)
+    sizes = {}
+    for name, dims in ROLLUPS.items():
+        # dropna=False: una collana (o un'altra dimensione) mancante non deve togliere le
+        # righe dai gruppi delle altre dimensioni
+        agg = df.groupby(dims, observed=True, dropna=False)[MEASURES].sum().reset_index()
+        for col in dims:
+            if isinstance(agg[col].dtype, pd.CategoricalDtype):
+                agg[col] = agg[col].cat.remove_unused_categories()
+        target = rollup_path(name, rollup_dir)
+        agg.to_parquet(target + ".tmp", compression="zstd", index=False)
+        os.replace(target + ".tmp", target)
+        sizes[name] = len(agg)
+    return sizes
+
+
+def filter_values(col, vals):
+    if col == "week":
+        return [week_number(v) for v in vals]
+    if col == "year":
+        return [int(v) for v in vals]
+    return list(vals)
+
+
+def pick_rollup(dims, rollup_dir=ROLLUP_DIR):
+    # Il rollup più piccolo che contiene tutte le dimensioni richieste
+    candidates = [
+        (pq.read_metadata(rollup_path(name, rollup_dir)).num_rows, name)
+        for name, rollup_dims in ROLLUPS.items()
+        if set(dims) <= set(rollup_dims) and os.path.exists(rollup_path(name, rollup_dir))
+    ]
+    return min(candidates)[1] if candidates else None
+
+
+def query_rollup(group_by, filters=None, rollup_dir=ROLLUP_DIR):
+    # Restituisce None se nessun rollup copre gruppo + filtri: il chiamante usa i dati grezzi
+    filters = {c: v for c, v in (filters or {}).items() if v is not None}
+    name = pick_rollup(list(group_by) + list(filters), rollup_dir)
+    if name is None:
+        return None
+    pq_filters = [(col, "in", filter_values(col, vals)) for col, vals in filters.items()]
+    df = pq.read_table(rollup_path(name, rollup_dir), filters=pq_filters or None).to_pandas()
+    df = apply_schema(df)
+    # Righe con dimensioni extra mancanti incluse; fuori solo le chiavi richieste mancanti,
+    # come nel groupby sulle righe del master
+    agg = df.groupby(list(group_by), observed=True, dropna=False)[MEASURES].sum().reset_index()
+    return agg.dropna(subset=list(group_by)).reset_index(drop=True)
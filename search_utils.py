@@ -0,0 +1,105 @@
+import os
+import bisect
+import unicodedata
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from ingest_utils import DATA_DIR
+from master_utils import MASTER_PATH, open_master
+
+VOCAB_PATH = os.path.join(DATA_DIR, "master_vocabulary.parquet")
+# Ordine della cascata: ogni colonna è ristretta dalle selezioni delle precedenti
+SEARCH_COLUMNS = ["publisher", "author", "title", "collana"]
+SEARCH_TOP_K = 50
+NGRAM = 3
+
+
+def build_vocabulary(master_path=MASTER_PATH, vocab_path=VOCAB_PATH):
+    # Combinazioni distinte editore/autore/titolo/collana con le vendite totali
+    df = open_master(master_path).to_table(columns=SEARCH_COLUMNS + ["units"]).to_pandas()
+    vocab = df.groupby(SEARCH_COLUMNS, observed=True, dropna=False)["units"].sum().reset_index()
+    for col in SEARCH_COLUMNS:
+        vocab[col] = vocab[col].cat.remove_unused_categories()
+    vocab.to_parquet(vocab_path + ".tmp", compression="zstd", index=False)
+    os.replace(vocab_path + ".tmp", vocab_path)
+    return len(vocab)
+
+
+def vocabulary_ready(vocab_path=VOCAB_PATH):
+    return os.path.exists(vocab_path)
+
+
+def load_vocabulary(vocab_path=VOCAB_PATH):
+    return pd.read_parquet(vocab_path)
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def ngrams(text, n=NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def build_search_index(vocab):
+    # Per colonna: valori ordinati per vendite (id basso = più venduto),
+    # lista ordinata per la ricerca per prefisso e liste di n-grammi per la sottostringa
+    index = {}
+    for col in SEARCH_COLUMNS:
+        totals = vocab.groupby(col, observed=True)["units"].sum().sort_values(ascending=False, kind="stable")
+        values = [str(v) for v in totals.index]
+        norm = [normalize_text(v) for v in values]
+        grams = defaultdict(list)
+        for i, v in enumerate(norm):
+            for g in ngrams(v):
+                grams[g].append(i)
+        prefix_order = sorted(range(len(norm)), key=norm.__getitem__)
+        index[col] = {
+            "values": values,
+            "ids": {v: i for i, v in enumerate(values)},
+            "norm": norm,
+            "prefix_keys": [norm[i] for i in prefix_order],
+            "prefix_ids": prefix_order,
+            "grams": {g: np.array(ids, dtype=np.int32) for g, ids in grams.items()},
+        }
+    return index
+
+
+def allowed_ids(index, vocab, col, selections):
+    # Valori di "col" compatibili con le selezioni delle colonne precedenti nella cascata
+    prior = [c for c in SEARCH_COLUMNS[:SEARCH_COLUMNS.index(col)] if selections.get(c)]
+    if not prior:
+        return None
+    mask = np.ones(len(vocab), dtype=bool)
+    for c in prior:
+        mask &= vocab[c].isin(selections[c]).to_numpy()
+    ids = index[col]["ids"]
+    return {ids[str(v)] for v in vocab.loc[mask, col].dropna().unique()}
+
+
+def search(index, col, query, k=SEARCH_TOP_K, allowed=None):
+    entry = index[col]
+    q = normalize_text(query)
+    if not q:
+        candidates = range(len(entry["values"]))
+    elif len(q) < NGRAM:
+        start = bisect.bisect_left(entry["prefix_keys"], q)
+        stop = bisect.bisect_left(entry["prefix_keys"], q + "\uffff")
+        candidates = sorted(entry["prefix_ids"][start:stop])
+    else:
+        postings = [entry["grams"].get(g) for g in ngrams(q)]
+        if any(p is None for p in postings):
+            return []
+        postings.sort(key=len)
+        ids = postings[0]
+        for p in postings[1:]:
+            ids = np.intersect1d(ids, p, assume_unique=True)
+        candidates = [i for i in ids.tolist() if q in entry["norm"][i]]
+    out = []
+    for i in candidates:
+        if allowed is None or i in allowed:
+            out.append(entry["values"][i])
+            if len(out) >= k:
+                break
+    return out
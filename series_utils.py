@@ -0,0 +1,133 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from ingest_utils import DATA_DIR, week_label
+
+# Serie settimanali per titolo: un'unica tabella Arrow ordinata per titolo, così i punti di
+# ogni titolo sono contigui. In lettura: offset per titolo + vettori numpy mappati dal file
+SERIES_PATH = os.path.join(DATA_DIR, "master_series.arrow")
+SERIES_SOURCE = ["title", "year", "week_num", "units", "fatturato", "rank"]
+# Copie per punto: più collane/edizioni dello stesso titolo si sommano, vale la posizione migliore
+# (rank 0 = posizione mancante: non conta per la migliore né per le settimane in top N)
+SERIES_AGG = {"units": "sum", "fatturato": "sum", "rank": "min"}
+# Soglia delle "settimane in top N" precalcolate al caricamento
+TOP_N = 10
+
+
+def build_series(df, series_path=SERIES_PATH):
+    df = df.assign(rank=df["rank"].where(df["rank"] > 0))
+    points = df.groupby(["title", "year", "week_num"], observed=True, sort=True).agg(SERIES_AGG).reset_index()
+    points["title"] = points["title"].cat.remove_unused_categories()
+    points["rank"] = points["rank"].fillna(0)
+    points = points.astype({"year": "int16", "week_num": "int8", "units": "int32", "rank": "int32"})
+    table = pa.Table.from_pandas(points, preserve_index=False).combine_chunks()
+    with pa.OSFile(series_path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(series_path + ".tmp", series_path)
+    return len(points)
+
+
+def per_title(values, offsets, ufunc, empty=0):
+    # Riduzione per segmento (somma, minimo...) in un solo passaggio vettoriale
+    counts = np.diff(offsets)
+    out = np.full(len(counts), empty, dtype=values.dtype)
+    nonempty = counts > 0
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def best_ranks(rank, offsets):
+    # Miglior posizione per titolo ignorando le posizioni mancanti (0 se non ne ha nessuna)
+    missing = np.iinfo(rank.dtype).max
+    best = per_title(np.where(rank > 0, rank, missing), offsets, np.minimum, empty=missing)
+    return np.where(best == missing, 0, best)
+
+
+def load_series(series_path=SERIES_PATH):
+    table = pa.ipc.open_file(pa.memory_map(series_path, "r")).read_all()
+    title = table.column("title").chunk(0)
+    codes = title.indices.to_numpy()
+    titles = title.dictionary.to_pylist()
+    offsets = np.searchsorted(codes, np.arange(len(titles) + 1))
+    store = {c: table.column(c).chunk(0).to_numpy() for c in SERIES_SOURCE[1:]}
+    # Periodi globali (anno, settimana) in ordine: indice del periodo per ogni punto
+    keys = store["year"].astype(np.int32) * 100 + store["week_num"]
+    periods, period = np.unique(keys, return_inverse=True)
+    store.update({
+        "titles": titles,
+        "lookup": {t: i for i, t in enumerate(titles)},
+        "offsets": offsets,
+        "periods": periods,
+        "period": period,
+        "weeks": np.diff(offsets),
+        "best_rank": best_ranks(store["rank"], offsets),
+        "total_units": per_title(store["units"].astype(np.int64), offsets, np.add),
+    })
+    store[f"weeks_top{TOP_N}"] = weeks_in_top(store, TOP_N)
+    return store
+
+
+def title_span(store, title):
+    i = store["lookup"].get(title)
+    if i is None:
+        return 0, 0
+    return int(store["offsets"][i]), int(store["offsets"][i + 1])
+
+
+def title_history(store, title):
+    # Storico completo del titolo: una fetta dei vettori, senza filtrare il master
+    start, stop = title_span(store, title)
+    history = pd.DataFrame({c: store[c][start:stop] for c in SERIES_SOURCE[1:]})
+    history.insert(2, "week", [week_label(w) for w in history["week_num"]])
+    return history
+
+
+def title_stats(store, titles, top_n=TOP_N):
+    idx = [store["lookup"][t] for t in titles if t in store["lookup"]]
+    return pd.DataFrame({
+        "title": [store["titles"][i] for i in idx],
+        "weeks": store["weeks"][idx],
+        "best_rank": store["best_rank"][idx],
+        f"weeks_top{top_n}": top_weeks(store, top_n)[idx],
+        "units": store["total_units"][idx],
+    })
+
+
+def weeks_in_top(store, n):
+    # Settimane con posizione 1..n per ogni titolo (scorre tutte le posizioni)
+    in_top = ((store["rank"] >= 1) & (store["rank"] <= n)).astype(np.int32)
+    return per_title(in_top, store["offsets"], np.add)
+
+
+def top_weeks(store, n=TOP_N):
+    # Riepilogo precalcolato da load_series; altre soglie si calcolano al momento
+    key = f"weeks_top{n}"
+    return store[key] if key in store else weeks_in_top(store, n)
+
+
+def top_titles(store, by="best_rank", n=20, top_n=TOP_N):
+    # Classifiche sui riepiloghi per titolo (best_rank crescente, il resto decrescente)
+    if by == "best_rank":
+        values = np.where(store["best_rank"] > 0, store["best_rank"], np.iinfo(np.int32).max)
+        order = np.lexsort((-store["weeks"], values))[:n]
+    else:
+        values = top_weeks(store, top_n) if by == "weeks_top" else store[by]
+        order = np.argsort(-values, kind="stable")[:n]
+    return title_stats(store, [store["titles"][i] for i in order], top_n)
+
+
+def sparklines(store, titles, n_periods=26):
+    # Unità delle ultime n settimane (0 se il titolo non era in classifica), una lista per titolo
+    first = max(0, len(store["periods"]) - n_periods)
+    width = len(store["periods"]) - first
+    out = []
+    for t in titles:
+        start, stop = title_span(store, t)
+        line = np.zeros(width, dtype=np.int64)
+        period = store["period"][start:stop]
+        recent = period >= first
+        line[period[recent] - first] = store["units"][start:stop][recent]
+        out.append(line.tolist())
+    return out
@@ -0,0 +1,183 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ingest_utils import DATA_DIR, week_label
+from master_utils import MASTER_PATH, MANIFEST_PATH, load_manifest, list_partitions, read_master
+
+# Tabella per titolo accanto al master: streak correnti/massime e settimane in classifica
+STREAK_PATH = os.path.join(DATA_DIR, "master_streaks.parquet")
+STREAK_KEY = ["publisher", "title", "collana"]
+STREAK_COLUMNS = STREAK_KEY + ["weeks_in_chart", "current_up", "current_down", "longest_up", "longest_down",
+                               "last_year", "last_week_num", "last_units"]
+COUNT_COLUMNS = ["weeks_in_chart", "current_up", "current_down", "longest_up", "longest_down"]
+
+
+def run_lengths(flags):
+    # Lunghezza della serie di True consecutivi che termina in ogni posizione
+    idx = np.arange(len(flags))
+    last_break = np.maximum.accumulate(np.where(flags, -1, idx))
+    return np.where(flags, idx - last_break, 0)
+
+
+def weekly_series(df, periods):
+    # Vendite per titolo e settimana, in ordine cronologico dentro ogni titolo;
+    # "period" è la posizione della settimana tra le partizioni del master
+    s = df.groupby(STREAK_KEY + ["year", "week_num"], observed=True, dropna=False)["units"].sum().reset_index()
+    codes = np.array([y * 100 + w for y, w in periods])
+    s["period"] = np.searchsorted(codes, s["year"].to_numpy(np.int64) * 100 + s["week_num"].to_numpy(np.int64))
+    return s
+
+
+def compute_streaks(df, periods):
+    # Un solo passaggio vettoriale su tutta la serie (titolo, settimana): la serie
+    # si interrompe al cambio di titolo e quando il titolo salta una settimana
+    s = weekly_series(df, periods)
+    if s.empty:
+        return pd.DataFrame(columns=STREAK_COLUMNS)
+    n = len(s)
+    key = s.groupby(STREAK_KEY, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    period = s["period"].to_numpy()
+    units = s["units"].to_numpy(np.int64)
+    new_key = np.r_[True, key[1:] != key[:-1]]
+    continuous = ~new_key & (np.r_[0, np.diff(period)] == 1)
+    diff = np.r_[0, np.diff(units)]
+    run_up = run_lengths(continuous & (diff > 0))
+    run_down = run_lengths(continuous & (diff < 0))
+
+    starts = np.flatnonzero(new_key)
+    ends = np.r_[starts[1:], n] - 1
+    # La streak "corrente" vale solo per i titoli presenti nell'ultima settimana
+    latest = period[ends] == len(periods) - 1
+    table = s.iloc[starts][STREAK_KEY].astype(object).reset_index(drop=True)
+    table["weeks_in_chart"] = np.diff(np.r_[starts, n])
+    table["current_up"] = np.where(latest, run_up[ends], 0)
+    table["current_down"] = np.where(latest, run_down[ends], 0)
+    table["longest_up"] = np.maximum.reduceat(run_up, starts)
+    table["longest_down"] = np.maximum.reduceat(run_down, starts)
+    table["last_year"] = s["year"].to_numpy()[ends]
+    table["last_week_num"] = s["week_num"].to_numpy()[ends]
+    table["last_units"] = units[ends]
+    return table
+
+
+def append_week(table, rows, year, week_num, previous):
+    # Aggiorna la tabella con una nuova settimana successiva a "previous" (anno, settimana)
+    week = rows.groupby(STREAK_KEY, observed=True, dropna=False)["units"].sum().reset_index()
+    week[STREAK_KEY] = week[STREAK_KEY].astype(object)
+    table = table.copy()
+    table[STREAK_KEY] = table[STREAK_KEY].astype(object)
+    merged = table.merge(week, on=STREAK_KEY, how="outer", indicator=True)
+    merged[COUNT_COLUMNS] = merged[COUNT_COLUMNS].fillna(0)
+
+    seen = (merged["_merge"] != "left_only").to_numpy()
+    was_previous = ((merged["last_year"] == previous[0]) & (merged["last_week_num"] == previous[1])).to_numpy()
+    continuous = seen & was_previous
+    diff = (merged["units"] - merged["last_units"]).fillna(0).to_numpy()
+    up = continuous & (diff > 0)
+    down = continuous & (diff < 0)
+
+    merged["current_up"] = np.where(up, merged["current_up"] + 1, 0)
+    merged["current_down"] = np.where(down, merged["current_down"] + 1, 0)
+    merged["longest_up"] = np.maximum(merged["longest_up"], merged["current_up"])
+    merged["longest_down"] = np.maximum(merged["longest_down"], merged["current_down"])
+    merged["weeks_in_chart"] += seen
+    merged["last_year"] = np.where(seen, year, merged["last_year"])
+    merged["last_week_num"] = np.where(seen, week_num, merged["last_week_num"])
+    merged["last_units"] = np.where(seen, merged["units"], merged["last_units"])
+    int_columns = COUNT_COLUMNS + ["last_year", "last_week_num", "last_units"]
+    merged[int_columns] = merged[int_columns].astype("int64")
+    return merged[STREAK_COLUMNS]
+
+
+def partition_signatures(manifest):
+    # (anno, settimana) → hash dei file sorgente della settimana: dice quali settimane sono cambiate
+    shas = {}
+    for e in manifest.get("files", {}).values():
+        shas.setdefault((e["year"], e["week"]), []).append(e["sha256"])
+    return {p: ",".join(sorted(s)) for p, s in shas.items()}
+
+
+def source_signature(manifest):
+    # Schema e tabella degli alias del master: se cambiano, i titoli vanno ricalcolati tutti
+    return [manifest.get("schema"), manifest.get("aliases")]
+
+
+def save_streaks(table, covered, streak_path=STREAK_PATH, source=None):
+    table = table[STREAK_COLUMNS].copy()
+    for col in COUNT_COLUMNS:
+        table[col] = table[col].astype("int16")
+    table["last_year"] = table["last_year"].astype("int16")
+    table["last_week_num"] = table["last_week_num"].astype("int8")
+    table["last_units"] = table["last_units"].astype("int64")
+    arrow = pa.Table.from_pandas(table, preserve_index=False)
+    meta = {**(arrow.schema.metadata or {}),
+            b"streak_partitions": json.dumps([[y, w, sha] for (y, w), sha in sorted(covered.items())]).encode(),
+            b"streak_source": json.dumps(source).encode()}
+    pq.write_table(arrow.replace_schema_metadata(meta), streak_path + ".tmp", compression="zstd")
+    os.replace(streak_path + ".tmp", streak_path)
+
+
+def covered_partitions(streak_path=STREAK_PATH, source=None):
+    # None se la tabella manca o viene da un master con altro schema/alias
+    if not os.path.exists(streak_path):
+        return None
+    meta = pq.read_schema(streak_path).metadata or {}
+    if b"streak_partitions" not in meta or json.loads(meta.get(b"streak_source", b"null")) != source:
+        return None
+    return {(y, w): sha for y, w, sha in json.loads(meta[b"streak_partitions"])}
+
+
+def streaks_ready(streak_path=STREAK_PATH):
+    return os.path.exists(streak_path)
+
+
+def update_streaks(master_path=MASTER_PATH, manifest_path=MANIFEST_PATH, streak_path=STREAK_PATH, full=False):
+    # Settimane nuove in coda → aggiornamento incrementale; altrimenti (o con full) ricalcolo completo
+    periods = list_partitions(master_path)
+    manifest = load_manifest(manifest_path)
+    signatures = partition_signatures(manifest)
+    source = source_signature(manifest)
+    current = {p: signatures.get(p) for p in periods}
+    covered = None if full else covered_partitions(streak_path, source)
+
+    if covered:
+        last = max(covered)
+        unchanged = all(current.get(p) == sha for p, sha in covered.items())
+        new = [p for p in periods if p not in covered]
+        if unchanged and all(p > last for p in new):
+            if not new:
+                return pq.read_metadata(streak_path).num_rows
+            table = pd.read_parquet(streak_path)
+            previous = last
+            for year, week_num in new:
+                rows = read_master(years=[year], weeks=[week_num], columns=STREAK_KEY + ["units"], master_path=master_path)
+                table = append_week(table, rows, year, week_num, previous)
+                previous = (year, week_num)
+            save_streaks(table, current, streak_path, source)
+            return len(table)
+
+    df = read_master(columns=STREAK_KEY + ["units", "year", "week_num"], master_path=master_path)
+    table = compute_streaks(df, periods)
+    save_streaks(table, current, streak_path, source)
+    return len(table)
+
+
+def load_streaks(streak_path=STREAK_PATH):
+    table = pd.read_parquet(streak_path)
+    table["last_week"] = [week_label(w) for w in table["last_week_num"]]
+    return table
+
+
+def streak_leaderboard(table, publishers=None, filters=None, by="longest_up", n=20):
+    # Classifica come semplice ricerca nella tabella precalcolata
+    mask = np.ones(len(table), dtype=bool)
+    if publishers is not None:
+        mask &= table["publisher"].isin(list(publishers)).to_numpy()
+    for col, vals in (filters or {}).items():
+        if vals:
+            mask &= table[col].isin(list(vals)).to_numpy()
+    order = [by] + [c for c in ["current_up", "last_units"] if c != by]
+    return table[mask].sort_values(order, ascending=False, kind="stable").head(n)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from filter_utils import publisher_slice
+from heatmap_utils import heatmap_cells, rank_rows
+from ingest_utils import week_label
+from matrix_utils import title_cube, yearly_totals, yoy_diff, yoy_pct, ytd, latest_week
+
+# Calcoli delle viste dedicate all'editore focus, senza Streamlit:
+# l'app li mette in cache per (versione master, filtri) e li disegna.
+
+
+def focus_rows(master, publisher_index, focus_publishers, filters):
+    rows = publisher_slice(master, publisher_index, focus_publishers)
+    for col in ["title", "collana"]:
+        if filters.get(col):
+            rows = rows[rows[col].isin(filters[col])]
+    return rows
+
+
+def title_key(df):
+    # Etichetta "titolo (collana)" per le heatmap
+    if "collana" in df.columns:
+        df["title_collana"] = df["title"].astype(object) + " (" + df["collana"].astype(object).fillna("—") + ")"
+        return "title_collana"
+    return "title"
+
+
+def weekly_title_units(rows):
+    grp = ["title", "week"]
+    if "collana" in rows.columns:
+        grp.insert(1, "collana")
+    key = ["title"] + (["collana"] if "collana" in grp else [])
+    # dropna=False: i titoli senza collana restano (riga "titolo (—)")
+    return rows.groupby(grp, observed=True, dropna=False)["units"].sum().reset_index(), key
+
+
+def variation_data(rows):
+    table, key = weekly_title_units(rows)
+    table["prev"] = table.groupby(key, observed=True, dropna=False)["units"].shift(1)
+    table["Diff_%"] = np.where(
+        table["prev"] > 0,
+        (table["units"] - table["prev"]) / table["prev"] * 100,
+        np.nan
+    )
+    idx = title_key(table)
+
+    cells = heatmap_cells(table, idx, "Diff_%")
+    return {"table": table, "cells": cells, "order": rank_rows(cells, idx), "idx": idx}
+
+
+def streak_data(rows):
+    # Solo la heatmap: le classifiche delle streak vengono dalla tabella per titolo (streak_utils)
+    table, key = weekly_title_units(rows)
+    table = table.sort_values(key + ["week"])
+    table["diff"] = table.groupby(key, observed=True, dropna=False)["units"].diff()
+    table["color"] = np.where(table["diff"] > 0, "green",
+                     np.where(table["diff"] < 0, "red", "white"))
+    idx = title_key(table)
+
+    cells = heatmap_cells(table, idx, "color")
+    return {"cells": cells, "order": rank_rows(cells, idx), "idx": idx}
+
+
+def insight_data(rows, summarize):
+    # summarize(group_by) → somme per gruppo (rollup precalcolato o groupby sulle righe)
+    out = {
+        "top_libri": summarize(["title"]).nlargest(20, "units")[["title", "units"]],
+        "top_autori": summarize(["author"]).nlargest(20, "units")[["author", "units"]],
+        "trend_total": summarize(["week"])[["week", "units"]],
+        "pie_collana": None,
+    }
+    if "collana" in rows.columns:
+        # Vendite senza collana in una fetta "—", come nelle heatmap
+        collana = rows["collana"].astype(object).fillna("—")
+        pie_collana = rows["units"].groupby(collana).sum().rename_axis("collana").reset_index()
+        out["pie_collana"] = pie_collana[pie_collana["units"] > 0]
+    return out
+
+
+def yoy_data(matrix, rows):
+    # Tutto per slice sulla matrice titolo × anno × settimana: niente pivot_table per anno
+    titles, cube = title_cube(matrix, rows)
+    years = matrix["years"]
+    year_idx, week_idx = np.nonzero(matrix["present"])
+    weekly = cube.sum(axis=0)
+    out = {
+        "trend_total": pd.DataFrame({
+            "year": years[year_idx],
+            "week": [week_label(w + 1) for w in week_idx],
+            "units": weekly[year_idx, week_idx],
+        }),
+        "pivot": None,
+        "top_confronto": None,
+    }
+    if len(titles) == 0:
+        return out
+
+    totals = yearly_totals(cube)
+    active = totals.sum(axis=0) > 0
+    years_list = [int(y) for y in years[active]]
+    if len(years_list) >= 2:
+        pivot = pd.DataFrame(totals[:, active].astype(float), index=pd.Index(titles, name="title"),
+                             columns=pd.Index(years_list, name="year"))
+        last, prev = years_list[-1], years_list[-2]
+        pivot["Diff"] = yoy_diff(cube, matrix, last, prev)
+        pivot["Diff_%"] = yoy_pct(cube, matrix, last, prev)
+        # Anno in corso parziale: progressivi alla stessa settimana
+        week = latest_week(matrix, last)
+        pivot[f"Progressivo {prev} (sett. {week})"] = ytd(cube, matrix, prev, week)
+        pivot[f"Progressivo {last} (sett. {week})"] = ytd(cube, matrix, last, week)
+        out["pivot"] = pivot
+
+    top = np.argsort(-totals.sum(axis=1), kind="stable")[:10]
+    t, y, w = np.nonzero(cube[top] * matrix["present"])
+    out["top_confronto"] = pd.DataFrame({
+        "title": titles[top][t],
+        "week": [week_label(n + 1) for n in w],
+        "year": years[y],
+        "units": cube[top][t, y, w],
+    })
+    return out
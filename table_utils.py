@@ -0,0 +1,93 @@
+import io
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+TABLE_PAGE_SIZE = 100
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/vnd.apache.parquet")}
+# Export già generati per (versione master, filtri, formato): pochi, perché possono essere grandi
+EXPORT_CACHE_SIZE = 4
+_export_cache = OrderedDict()
+_export_lock = threading.Lock()
+
+
+def sort_key(series):
+    # Le categorie non sono in ordine alfabetico: si ordina per rango del valore, non per codice
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        cats = series.cat.categories
+        ranks = np.empty(len(cats) + 1)
+        if series.cat.ordered:
+            ranks[:-1] = np.arange(len(cats))
+        else:
+            ranks[np.argsort(cats.astype(str), kind="stable")] = np.arange(len(cats))
+        ranks[-1] = np.nan  # valori mancanti (codice -1)
+        return ranks[series.cat.codes.to_numpy()]
+    return series.to_numpy()
+
+
+def sort_positions(df, positions, by, ascending=True):
+    keys = pd.Series(sort_key(df[by])[positions])
+    order = keys.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+    sorted_positions = positions[order]
+    sorted_positions.flags.writeable = False
+    return sorted_positions
+
+
+def top_rows(df, positions, col, n):
+    # Come df.take(positions).nlargest(n, col), senza copiare tutte le righe filtrate
+    values = df[col].to_numpy()[positions]
+    return df.take(positions[np.argsort(-values, kind="stable")[:n]])
+
+
+def table_page(df, positions, page=1, page_size=TABLE_PAGE_SIZE):
+    # Solo le righe della pagina visibile arrivano al browser
+    n_pages = max(1, -(-len(positions) // page_size))
+    page = min(max(1, int(page)), n_pages)
+    start = (page - 1) * page_size
+    rows = positions[start:start + page_size]
+    return {"rows": df.take(rows), "page": page, "n_pages": n_pages, "first": start + 1, "last": start + len(rows)}
+
+
+def iter_chunks(df, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(positions), chunk_rows):
+        yield df.take(positions[start:start + chunk_rows])
+
+
+def write_csv(df, positions, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    out.write(df.iloc[0:0].to_csv(index=False).encode())
+    for chunk in iter_chunks(df, positions, chunk_rows):
+        out.write(chunk.to_csv(index=False, header=False).encode())
+
+
+def write_parquet(df, positions, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Un row group per blocco: non si materializza mai l'intera selezione
+    schema = pa.Schema.from_pandas(df.iloc[0:0], preserve_index=False)
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for chunk in iter_chunks(df, positions, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def export_bytes(df, positions, fmt, cache_key=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Generato solo su richiesta (download), a blocchi, e tenuto in cache per filtro
+    key = (cache_key, fmt)
+    if cache_key is not None:
+        with _export_lock:
+            if key in _export_cache:
+                _export_cache.move_to_end(key)
+                return _export_cache[key]
+
+    out = io.BytesIO()
+    writer = write_parquet if EXPORT_FORMATS[fmt][0] == "parquet" else write_csv
+    writer(df, positions, out, chunk_rows)
+    data = out.getvalue()
+
+    if cache_key is not None:
+        with _export_lock:
+            _export_cache[key] = data
+            while len(_export_cache) > EXPORT_CACHE_SIZE:
+                _export_cache.popitem(last=False)
+    return data
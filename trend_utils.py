@@ -0,0 +1,17 @@
+import pandas as pd
+
+
+def weekly_trend(df, dim, items=None, weeks=None):
+    # Un solo groupby (settimana, item) al posto dei cicli settimana × item.
+    # Con "weeks" le combinazioni mancanti diventano 0, come nei grafici cumulativi.
+    if items is not None:
+        df = df[df[dim].isin(items)]
+    trend = df.groupby(["week", dim], observed=True)["units"].sum().reset_index()
+    trend = trend.rename(columns={dim: "item"})
+    trend["week"] = trend["week"].astype(str)
+    trend["item"] = trend["item"].astype(str)
+    if weeks is not None and items is not None:
+        grid = pd.MultiIndex.from_product([list(weeks), [str(i) for i in items]], names=["week", "item"])
+        trend = trend.set_index(["week", "item"]).reindex(grid, fill_value=0).reset_index()
+    trend["units"] = trend["units"].astype(int)
+    return trend[["week", "item", "units"]]
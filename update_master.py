@@ -1 +1,6 @@
+# update_master.py → stesso builder di create_parquet.py (nome storico, es. per cron)
+import sys
+from create_parquet import main
 
+if __name__ == "__main__":
+    sys.exit(main())
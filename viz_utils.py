@@ -1,7 +1,11 @@
 import altair as alt
 import pandas as pd
 from data_utils import aggregate_all_weeks
+from ingest_utils import week_number
+from trend_utils import weekly_trend
+from perf_utils import timed
 
+@timed("create_top_books_chart")
 def create_top_books_chart(filtered_df):
     top_books = filtered_df.nlargest(20, "units")[["title", "units"]]
     if len(top_books) > 1:
@@ -13,6 +17,7 @@ def create_top_books_chart(filtered_df):
         return chart
     return None
 
+@timed("create_top_authors_chart")
 def create_top_authors_chart(filtered_df):
     author_units = filtered_df.groupby("author")["units"].sum()
     author_units = author_units[author_units.index != 'AA.VV.']
@@ -26,6 +31,7 @@ def create_top_authors_chart(filtered_df):
         return chart
     return None
 
+@timed("create_top_publishers_chart")
 def create_top_publishers_chart(filtered_df):
     top_publishers = filtered_df.groupby("publisher")["units"].sum().nlargest(10).reset_index()
     if len(top_publishers) > 1:
@@ -37,6 +43,7 @@ def create_top_publishers_chart(filtered_df):
         return chart
     return None
 
+@timed("create_trend_chart")
 def create_trend_chart(trend_df, legend_title='Item'):
     chart = alt.Chart(trend_df).mark_line(point=True).encode(
         x=alt.X('Settimana:N', sort=alt.EncodingSortField(field='Week_Num', order='ascending'), title='Settimana'),
@@ -46,28 +53,27 @@ def create_trend_chart(trend_df, legend_title='Item'):
     ).properties(width='container').interactive()
     return chart
 
+@timed("create_publisher_books_trend_chart")
 def create_publisher_books_trend_chart(dataframes, selected_publisher):
     publisher_books = aggregate_all_weeks(dataframes)
     if publisher_books is None:
         return None
     publisher_books = publisher_books[publisher_books['publisher'].isin(selected_publisher)]
     top_20_titles = publisher_books.nlargest(20, 'units')['title'].tolist()
-    trend_data_publisher_books = []
-    for week, week_df in sorted(dataframes.items(), key=lambda x: int(re.search(r'Settimana\s*(\d+)', x[0], re.IGNORECASE).group(1))):
-        week_num = int(re.search(r'Settimana\s*(\d+)', week, re.IGNORECASE).group(1))
-        if week_df is not None:
-            week_filtered = week_df[week_df['publisher'].isin(selected_publisher)]
-            if not week_filtered.empty:
-                for title in top_20_titles:
-                    title_df = week_filtered[week_filtered['title'] == title]
-                    if not title_df.empty:
-                        trend_data_publisher_books.append({"Settimana": week, "Unità Vendute": title_df["units"].sum(), "Libro": title, "Week_Num": week_num})
-    if not trend_data_publisher_books:
+    weeks = [df.assign(week=week) for week, df in dataframes.items() if df is not None]
+    if not weeks:
         return None
-    trend_df_publisher_books = pd.DataFrame(trend_data_publisher_books)
+    combined = pd.concat(weeks, ignore_index=True)
+    combined = combined[combined['publisher'].isin(selected_publisher)]
+    trend = weekly_trend(combined, 'title', top_20_titles)
+    if trend.empty:
+        return None
+    trend_df_publisher_books = trend.rename(columns={"week": "Settimana", "units": "Unità Vendute", "item": "Libro"})
+    trend_df_publisher_books["Week_Num"] = trend_df_publisher_books["Settimana"].map(week_number)
     trend_df_publisher_books.sort_values('Week_Num', inplace=True)
     return trend_df_publisher_books
 
+@timed("create_heatmap")
 def create_heatmap(pivot_df, pivot_index='title'):
     heatmap = alt.Chart(pivot_df).mark_rect().encode(
         x=alt.X('Settimana:O', sort=alt.EncodingSortField(field='Week_Num', order='ascending'), title='Settimana'),
@@ -76,3 +82,57 @@ def create_heatmap(pivot_df, pivot_index='title'):
         tooltip=[pivot_index, 'Settimana', 'units', alt.Tooltip('Diff_pct:Q', format='.2f')]
     ).properties(width='container').interactive(bind_y=True)
     return heatmap
+
+# Grafici delle viste focus: usati dall'app (misurati da show_chart) e dai report batch (batch_report.py)
+def variation_heatmap(cells, idx, rows, week_order):
+    return alt.Chart(cells).mark_rect(
+        stroke='gray',
+        strokeWidth=0.5
+    ).encode(
+        x=alt.X("week:N", sort=week_order, title="Settimana"),
+        y=alt.Y(f"{idx}:N", sort=rows),
+        color=alt.Color("Diff_%:Q", scale=alt.Scale(scheme="redyellowgreen", domainMid=0), title="Variazione %"),
+        tooltip=[idx, "week", alt.Tooltip("units:Q", title="Unità vendute"), alt.Tooltip("Diff_%:Q", format=".1f", title="Variazione %")]
+    ).properties(
+        width=900,
+        height=max(600, len(rows) * 20)  # 20px per libro
+    ).configure_axis(labelFontSize=11, titleFontSize=13)
+
+def streak_heatmap(cells, idx, rows, week_order):
+    return alt.Chart(cells).mark_rect(
+        stroke='gray',
+        strokeWidth=0.5
+    ).encode(
+        x=alt.X("week:N", sort=week_order, title="Settimana"),
+        y=alt.Y(f"{idx}:N", sort=rows),
+        color=alt.Color("color:N", scale=alt.Scale(domain=["green","white","red"], range=["green","white","red"]), legend=None),
+        tooltip=[idx, "week", alt.Tooltip("units:Q", title="Unità vendute")]
+    ).properties(
+        width=900,
+        height=max(600, len(rows) * 20)  # 20px per libro
+    )
+
+def top_bar_chart(df, col):
+    return alt.Chart(df).mark_bar().encode(x=alt.X(f"{col}:N", sort="-y"), y="units:Q")
+
+def collana_pie_chart(df):
+    return alt.Chart(df).mark_arc().encode(
+        theta="units:Q",
+        color="collana:N",
+        tooltip=["collana", "units"]
+    ).properties(height=400)
+
+def weekly_units_chart(df, week_order, by_year=False, height=400):
+    encoding = {"x": alt.X("week:N", sort=week_order), "y": "units:Q"}
+    if by_year:
+        encoding["color"] = "year:N"
+    return alt.Chart(df).mark_line(point=True).encode(**encoding).properties(height=height)
+
+def yoy_titles_chart(df, week_order):
+    return alt.Chart(df).mark_line(point=True).encode(
+        x=alt.X("week:N", sort=week_order),
+        y="units:Q",
+        color="year:N",
+        detail="title:N",
+        tooltip=["title", "week", "year", "units"]
+    ).properties(height=500)